@@ -25,6 +25,9 @@ limitations under the License.
 from bitstring import BitStream
 from vdes1000.trx import VDESTransceiver
 
+# Zeroed PI Data Payload (32 bytes)
+_ZERO_32B = bytes(32)
+
 if __name__=='__main__':
 
     # VDES1000 Transceiver configuration (ip_address and dest_port_* must match
@@ -47,7 +50,7 @@ if __name__=='__main__':
     # Create a PI Data Payload to be transmitted over VDE
     # Note: The size must be an integer multiple of 8 bits, otherwise the
     # payload will be rejected by the VDES1000 unit.
-    pi_data_payload_bs = BitStream(8 * 32)
+    pi_data_payload_bs = BitStream(bytes=_ZERO_32B)
 
     # Initiate an addressed data transfer
     vdes_trx.send_vde_data(pi_data_payload_bs, destination_id="992359599")
@@ -26,14 +26,26 @@ limitations under the License.
 # %% Import Statements
 # =============================================================================
 # Built-in Modules ------------------------------------------------------------
+import os
+import selectors
 import socket
+import sys
+from threading import local
 
 # Third-party Modules ---------------------------------------------------------
 import yaml
+try:
+    # Use the LibYAML-based loader where available
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 
 # Local Modules ---------------------------------------------------------------
 from vdes1000.utils import ts_print as print
+from vdes1000.utils import to_namespace
+from vdes1000.utils import ts_print_async
 from vdes1000.trx import VDESTransceiver
+from vdes1000.udp import SendmmsgBatcher
 
 # =============================================================================
 # %% Function Definitions
@@ -42,6 +54,38 @@ def recv_cbk_misc(address, data):
     # Do stuff with received data
     pass
 
+def wait_for_enter(prompt):
+    """
+    Display a prompt and wait for the user to press Enter.
+
+    Polls stdin with a selector rather than blocking in input(), so the main
+    thread only wakes up briefly every half a second while the receiving
+    threads do their work. Falls back to input() on Windows, where selectors
+    do not support stdin.
+
+    Parameters
+    ----------
+    prompt : str
+        User prompt.
+
+    Returns
+    -------
+    None.
+
+    """
+    if sys.platform == "win32":
+        input(prompt)
+        return
+
+    print(prompt, end="", flush=True)
+
+    with selectors.DefaultSelector() as sel:
+        sel.register(sys.stdin, selectors.EVENT_READ)
+        while not sel.select(0.5):
+            pass
+
+    sys.stdin.readline()
+
 # =============================================================================
 # %% Class Definitions
 # =============================================================================
@@ -51,20 +95,52 @@ class VDESProcessor:
 
     Currently this is used only to forward the received data to OpenCPN.
 
+    Forwarded data is sent in batches (see vdes1000.udp.SendmmsgBatcher);
+    call close() on shutdown to send any data still queued.
+
     Parameters
     ----------
     ip_address : str
         Destination address.
     port : int
         Destination port.
+    buffer_size : int, optional
+        Size of each pre-allocated forwarding buffer (bytes).
+        The default is 65535 (maximum UDP payload size).
+    sndbuf_bytes : int, optional
+        Kernel send buffer size (SO_SNDBUF) of the forwarding socket (bytes).
+        On Linux, the effective value is capped by net.core.wmem_max.
+        The default is 12582912.
+    send_cpu : int, optional
+        CPU core to pin the threads calling process_rx_data() to (Linux
+        only). Takes precedence over any affinity set for the receiving
+        threads of the UDP interface. If None, no pinning is done.
+        The default is None.
 
     """
-    def __init__(self, ip_address, port):
+    def __init__(self, ip_address, port, buffer_size=65535,
+                 sndbuf_bytes=12582912, send_cpu=None):
         self.ip_address = ip_address
         self.port = port
+        self.send_cpu = send_cpu
+
+        # Tracks which callback threads have already been pinned
+        self._thread_state = local()
 
         # Create the "send" UDP socket
         self.udp_send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_send_sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, sndbuf_bytes)
+
+        # All data goes to the same destination, so connect the socket once
+        # and use send() rather than sendto() for every packet
+        self.udp_send_sock.connect((ip_address, port))
+
+        # Coalesce forwarded packets into batches sent with one system call.
+        # The batcher copies the data into its own pre-allocated buffers.
+        self.batcher = SendmmsgBatcher(
+            self.udp_send_sock,
+            buffer_size=buffer_size)
 
     def process_rx_data(self, address, data):
         """
@@ -74,6 +150,11 @@ class VDESProcessor:
 
         Forwards the received data to the target address and port.
 
+        Safe to call from several receiving threads concurrently: the
+        forwarding buffers are only accessed through the batcher, which
+        serialises access with its own lock, and the CPU pinning state is
+        kept per thread.
+
         Parameters
         ----------
         address : tuple (ip_address, port)
@@ -86,16 +167,35 @@ class VDESProcessor:
         None.
 
         """
-        # Send data
-        self.udp_send_sock.sendto(
-            # data.encode(), # Use UTF-8 encoding
-            data,
-            (self.ip_address, self.port))
-
-        print(
+        # Pin the calling thread on first use
+        if (self.send_cpu is not None
+                and not getattr(self._thread_state, "pinned", False)):
+            os.sched_setaffinity(0, {self.send_cpu})
+            self._thread_state.pinned = True
+            print("Forwarding thread pinned to CPU(s) {}".format(
+                sorted(os.sched_getaffinity(0))), flush=True)
+
+        # Queue the data for sending. The batcher sends through the socket's
+        # cached file descriptor via ctypes, which releases the GIL for the
+        # duration of the system call.
+        self.batcher.send(data)
+
+        # Print without holding up the receiving thread
+        ts_print_async(
             "\nData sent to {:s}:{:d}: \n".format(self.ip_address, self.port),
-            data,
-            flush=True)
+            data)
+
+    def close(self):
+        """
+        Send any queued data and close the forwarding socket.
+
+        Returns
+        -------
+        None.
+
+        """
+        self.batcher.close()
+        self.udp_send_sock.close()
 
 # =============================================================================
 # %% Environment Initialisation
@@ -123,7 +223,7 @@ vp = VDESProcessor(ip_address="127.0.0.1", port=2947)
 
 # Load the configuration file for VDES Transceiver 2
 with open("vdes_trx_2.yaml") as file:
-    trx_cfg = yaml.full_load(file)
+    trx_cfg = to_namespace(yaml.load(file, Loader=SafeLoader))
 
 # Initialise a VDES Transceiver object
 vdes_trx = VDESTransceiver(
@@ -141,7 +241,7 @@ Running -----------------------------------------------------------------------
 
 # Wait for user to press Enter. Receive events are handled by the callback
 # functions specified when initialising vdes_trx.
-input("\nPress Enter to exit.")
+wait_for_enter("\nPress Enter to exit.")
 
 print(
 """
@@ -150,3 +250,6 @@ Exiting -----------------------------------------------------------------------
 
 # Close the recieving UDP sockets and stop the associated threads
 vdes_trx.udp_interface.close()
+
+# Send any queued data and close the forwarding socket
+vp.close()
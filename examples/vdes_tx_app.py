@@ -30,14 +30,36 @@ from time import sleep
 
 # Third-party Modules ---------------------------------------------------------
 import yaml
+try:
+    # Use the LibYAML-based loader where available
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
 from bitstring import BitStream
 
 # Local Modules ---------------------------------------------------------------
 from vdes1000.utils import ts_print as print
+from vdes1000.utils import to_namespace
 from rec_itu_r_m_1371.messages import AISMessage21, AISMessage8
 from rec_itu_r_m_1371.asm_payloads import SampleASMPayload1
 from vdes1000.trx import VDESTransceiver
 
+# =============================================================================
+# %% Constants
+# =============================================================================
+# Zeroed PI Data Payload (96 bytes)
+_ZERO_96B = bytes(96)
+
+# Main menu; only the channel names are filled in on each iteration
+_MENU_TEMPLATE = """
+0 - Exit
+1 - Transmit AIS Message 21 (AtoN) on {ais_ch}
+2 - Transmit AIS Message 8 (Binary Broadcast Message on {ais_ch}
+3 - Transmit a VDES-ASM Broadcast Message on {asm_ch}
+4 - Send an Addressed VDE Data Transmission
+5 - Toggle AIS channel
+6 - Toggle ASM channel"""
+
 # =============================================================================
 # %% Function Definitions
 # =============================================================================
@@ -90,12 +112,13 @@ def user_input(prompt, var_type, limits=None, default=None):
             done = True
             value = default
         if var_type == "int":
-            try:
+            # Only convert strings of decimal digits (with an optional minus
+            # sign and surrounding whitespace, as accepted by int()) rather
+            # than catching int() exceptions
+            if not done and value.strip().removeprefix("-").isdecimal():
                 value = int(value)
                 if (limits is None) or (limits[0] <= value <= limits[1]):
                     done = True
-            except:
-                pass
         elif var_type == "str":
             done = True
         else:
@@ -129,11 +152,11 @@ Initialising ------------------------------------------------------------------
 
 # Load the configuration file for VDES Transceiver 1
 with open("vdes_trx_1.yaml") as file:
-    trx_cfg = yaml.full_load(file)
+    trx_cfg = to_namespace(yaml.load(file, Loader=SafeLoader))
 
 # Load the message configuration file
 with open("messages.yaml") as file:
-    messages = yaml.full_load(file)
+    messages = yaml.load(file, Loader=SafeLoader)
 
 # Initialise an AIS Message 21 object
 ais_msg_21 = AISMessage21(**messages["ais_msg_21"])
@@ -146,13 +169,19 @@ ais_msg_8 = AISMessage8(
     source_id=messages["ais_msg_8"]["source_id"],
     payload=ais_asm_payload)
 
+# The AIS messages do not change, so encode them only once
+ais_msg_21_bs = ais_msg_21.bitstream
+ais_msg_8_bs = ais_msg_8.bitstream
+ais_asm_payload_bs = ais_asm_payload.bitstream
+
 # VDES-ASM payload - may be larger than the AIS one
 vdes_asm_payload = SampleASMPayload1(
     n_app_data_bytes=messages["vdes_asm_payload"]["n_app_data_bytes"])
+vdes_asm_payload_bs = vdes_asm_payload.bitstream
 
 # Create a PI Data Payload to be transmitted over VDE
 # Note: The size must be an integer multiple of 8 bits.
-pi_data_payload_bs = BitStream(384*2)
+pi_data_payload_bs = BitStream(bytes=_ZERO_96B)
 
 # Initialise a VDES Transceiver object
 vdes_trx = VDESTransceiver(
@@ -160,6 +189,12 @@ vdes_trx = VDESTransceiver(
     recv_cbk_misc=recv_cbk_misc,
     recv_cbk_aist=recv_cbk_aist)
 
+# Bind the transmit methods once, outside the main loop
+send_ais_msg = vdes_trx.send_ais_msg
+send_ais_binary_broadcast = vdes_trx.send_ais_binary_broadcast
+send_asm_broadcast = vdes_trx.send_asm_broadcast
+send_vde_data = vdes_trx.send_vde_data
+
 # AIS transmit channel
 ais_tx_ch = ["AIS 1", "AIS 2"]
 i_ais_tx_ch = 0
@@ -180,14 +215,10 @@ flush=True)
 while True:
 
     print(
-f"""
-0 - Exit
-1 - Transmit AIS Message 21 (AtoN) on {ais_tx_ch[i_ais_tx_ch]}
-2 - Transmit AIS Message 8 (Binary Broadcast Message on {ais_tx_ch[i_ais_tx_ch]}
-3 - Transmit a VDES-ASM Broadcast Message on {asm_tx_ch[i_asm_tx_ch]}
-4 - Send an Addressed VDE Data Transmission
-5 - Toggle AIS channel
-6 - Toggle ASM channel""", flush=True)
+        _MENU_TEMPLATE.format(
+            ais_ch=ais_tx_ch[i_ais_tx_ch],
+            asm_ch=asm_tx_ch[i_asm_tx_ch]),
+        flush=True)
 
     # Ask for user input and act on it
     ui = user_input("\nSelect action", "int", limits=[0,6])
@@ -201,21 +232,21 @@ Exiting -----------------------------------------------------------------------
 
     elif ui == 1:
         # Send AIS Message 21 on the requested channel
-        vdes_trx.send_ais_msg(
-            msg_bs=ais_msg_21.bitstream,
+        send_ais_msg(
+            msg_bs=ais_msg_21_bs,
             channel=ais_tx_ch[i_ais_tx_ch])
 
     elif ui == 2:
         # Send AIS binary broadcast message on the requested channel
         # and using the requested method
-        if trx_cfg["user"]["ais_bin_broadcast_method"] == "tsa-vdm":
-            vdes_trx.send_ais_msg(
-                msg_bs=ais_msg_8.bitstream,
+        if trx_cfg.user.ais_bin_broadcast_method == "tsa-vdm":
+            send_ais_msg(
+                msg_bs=ais_msg_8_bs,
                 channel=ais_tx_ch[i_ais_tx_ch])
 
-        elif trx_cfg["user"]["ais_bin_broadcast_method"] == "bbm":
-            vdes_trx.send_ais_binary_broadcast(
-                asm_payload_bs=ais_asm_payload.bitstream,
+        elif trx_cfg.user.ais_bin_broadcast_method == "bbm":
+            send_ais_binary_broadcast(
+                asm_payload_bs=ais_asm_payload_bs,
                 channel=ais_tx_ch[i_ais_tx_ch],
                 msg_id=8)
 
@@ -224,15 +255,15 @@ Exiting -----------------------------------------------------------------------
 
     elif ui == 3:
         # Send a VDES-ASM Broadcast Message on the requested channel
-        vdes_trx.send_asm_broadcast(
-            asm_payload_bs=vdes_asm_payload.bitstream,
+        send_asm_broadcast(
+            asm_payload_bs=vdes_asm_payload_bs,
             source_id=messages["asm_broadcast"]["source_id"],
             channel=asm_tx_ch[i_asm_tx_ch],
             transmission_format=messages["asm_broadcast"]["transmission_format"])
 
     elif ui == 4:
         # Initiate an addressed VDE data transmission
-        vdes_trx.send_vde_data(
+        send_vde_data(
             pi_data_payload_bs=pi_data_payload_bs,
             destination_id="992359599")
 
@@ -242,9 +273,10 @@ Exiting -----------------------------------------------------------------------
     elif ui == 6:
         i_asm_tx_ch = (i_asm_tx_ch + 1) % len(asm_tx_ch)
 
-    # Provide time for communications to happen before printing the menu again
+    # Wait for the VDES1000 to respond (or at most 5 s) before printing the
+    # menu again
     if 0 < ui < 5:
-        sleep(5)
+        vdes_trx.wait_for_response(timeout=5)
 
 # Close the recieving UDP sockets and stop the associated threads
 vdes_trx.udp_interface.close()
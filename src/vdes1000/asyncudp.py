@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio UDP Interface Module.
+
+This module provides an asyncio-based alternative to the UDP interface
+defined in the udp module, serving all UDP sockets from a single event loop
+thread.
+
+@author: Jan Safar
+
+Copyright 2024 GLA Research and Development Directorate
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+# =============================================================================
+# %% Import Statements
+# =============================================================================
+import asyncio
+import socket
+from threading import Thread
+
+from vdes1000.udp import (
+    DEFAULT_SOCKET_BUFFER_BYTES,
+    IP_MULTICAST_ALL,
+    SO_REUSEPORT,
+    decode_data,
+    encode_msg,
+    make_data_logger,
+    make_recv_handler,
+    set_socket_buffer,
+    setsockopt_best_effort)
+from vdes1000.utils import NULL_LOG, ts_print as print
+
+
+# =============================================================================
+# %% Class Definitions
+# =============================================================================
+class _UDPProtocol(asyncio.DatagramProtocol):
+    """
+    Datagram protocol passing received datagrams to a handler, in the event
+    loop thread.
+
+    Parameters
+    ----------
+    handler : function
+        Function called per received datagram, e.g. a receive event callback
+        function (see AsyncUDPInterface and vdes1000.udp.make_recv_handler()).
+    verbosity : int
+        Verbosity level; errors are printed if > 0.
+
+    """
+    def __init__(self, handler, verbosity):
+        self.handler = handler
+        self.verbosity = verbosity
+
+        # Done once the transport has been closed
+        self.closed = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        self.handler(addr, data)
+
+    def error_received(self, exc):
+        # Datagrams refused by the destination (nothing listening) are
+        # dropped, as they would be with an unconnected socket
+        if self.verbosity > 0 and not isinstance(exc, ConnectionRefusedError):
+            print(exc, flush=True)
+
+    def connection_lost(self, exc):
+        if not self.closed.done():
+            self.closed.set_result(None)
+
+class AsyncUDPInterface():
+    """
+    A class to manage UDP communications with a VDES1000 unit, using asyncio.
+
+    All sockets are served by a single thread running an asyncio event loop
+    (epoll/kqueue), in which the receive callbacks are also called, so that
+    received data is not passed between threads. The send methods may be
+    called from any thread: they hand the messages over to the event loop
+    and return immediately.
+
+    The interface offers the same methods as vdes1000.udp.UDPInterface. It
+    suits receive callbacks that are short, as they block the event loop,
+    including sending, while they run. UDPInterface remains preferable where
+    its batched receiving/sending (recvmmsg()/sendmmsg()), several receiving
+    threads per port or CPU pinning are needed.
+
+    Parameters
+    ----------
+    ip_address : str
+        IP address of the VDES1000.
+    dest_port_misc : int
+        Destination UDP port for miscelaneous sentences.
+    dest_port_aist : int
+        Destination UDP port for AIS target data sentences.
+    dest_port_ccrd : int
+        Destination UDP port for command and command response sentences.
+    listen_misc : bool, optional
+        Listen on dest_port_misc if True. The default is True.
+    listen_aist : bool, optional
+        Listen on dest_port_aist if True. The default is True.
+    listen_ccrd : bool, optional
+        Listen on dest_port_ccrd if True. The default is True.
+    recv_cbk_misc : function, optional
+        Receive event callback function for dest_port_misc, called in the
+        event loop thread.
+
+        Expected arguments:
+
+        address : tuple, (ip_address, port)
+            Source address.
+        data : bytes
+            Received data.
+
+        The default is None.
+    recv_cbk_aist : function, optional
+        Receive event callback function for dest_port_aist.
+        See also recv_cbk_misc.
+        The default is None.
+    recv_cbk_ccrd : function, optional
+        Receive event callback function for dest_port_ccrd.
+        See also recv_cbk_misc.
+        The default is None.
+    sndbuf_bytes : int, optional
+        Kernel send buffer size (SO_SNDBUF) for the sending socket (bytes).
+        If None, the operating system default is used.
+        The default is DEFAULT_SOCKET_BUFFER_BYTES (4 MiB).
+    rcvbuf_bytes : int, optional
+        Kernel receive buffer size (SO_RCVBUF) for the receiving sockets
+        (bytes). If None, the operating system default is used.
+        The default is DEFAULT_SOCKET_BUFFER_BYTES (4 MiB).
+    reuse_port : bool, optional
+        If True, the receiving sockets are bound with SO_REUSEPORT where
+        available. See vdes1000.udp.UDPInterface. The default is False.
+    ip_multicast_all : bool, optional
+        IP_MULTICAST_ALL value for the receiving sockets (Linux only). See
+        vdes1000.udp.UDPInterface. The default is False.
+    ip_multicast_loop : bool, optional
+        IP_MULTICAST_LOOP value for the sending socket. See
+        vdes1000.udp.UDPInterface. The default is False.
+    verbosity : int, optional
+        Verbosity for the UDP interface (0-3) - set > 0 for debugging.
+        The default is 0.
+
+    """
+    def __init__(
+            self,
+            ip_address,
+            dest_port_misc,
+            dest_port_aist,
+            dest_port_ccrd,
+            listen_misc=True,
+            listen_aist=True,
+            listen_ccrd=True,
+            recv_cbk_misc=None,
+            recv_cbk_aist=None,
+            recv_cbk_ccrd=None,
+            sndbuf_bytes=DEFAULT_SOCKET_BUFFER_BYTES,
+            rcvbuf_bytes=DEFAULT_SOCKET_BUFFER_BYTES,
+            reuse_port=False,
+            ip_multicast_all=False,
+            ip_multicast_loop=False,
+            verbosity=0):
+
+        # Initialise attributes
+        self.ip_address = ip_address
+        self.dest_port_misc = dest_port_misc
+        self.dest_port_aist = dest_port_aist
+        self.dest_port_ccrd = dest_port_ccrd
+        self.listen_misc = listen_misc
+        self.listen_aist = listen_aist
+        self.listen_ccrd = listen_ccrd
+        self.sndbuf_bytes = sndbuf_bytes
+        self.rcvbuf_bytes = rcvbuf_bytes
+        self.reuse_port = reuse_port
+        self.ip_multicast_all = ip_multicast_all
+        self.ip_multicast_loop = ip_multicast_loop
+        self.verbosity = verbosity
+
+        # Debugging output for sent/received data, no-op if verbosity < 2
+        self._log_send = make_data_logger(verbosity, "sent to", repr)
+        self._log_recv = make_data_logger(
+            verbosity, "received from", decode_data)
+
+        self._misc_address = (ip_address, dest_port_misc)
+
+        # Ports to listen on and their receive callbacks
+        # TODO: Add dest_port_ccrd
+        rx_ports = []
+        if listen_misc is True:
+            rx_ports.append((self.dest_port_misc, recv_cbk_misc))
+        if listen_aist is True:
+            rx_ports.append((self.dest_port_aist, recv_cbk_aist))
+
+        # Sockets opened by the event loop thread, as tuples (transport,
+        # protocol, port), with port None for the sending socket
+        self._send_transport = None
+        self._endpoints = []
+
+        # Messages handed over before the sending socket is open, sent once
+        # it is (None afterwards)
+        self._pending_tx = []
+
+        # Start the event loop thread and open the sockets in it
+        self._loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self._loop.run_forever, daemon=True)
+        self.thread.start()
+
+        self._started = asyncio.run_coroutine_threadsafe(
+            self._start(rx_ports), self._loop)
+
+    @property
+    def n_listening_ports(self):
+        """
+        Returns
+        -------
+        int
+            Total number of ports the user wishes to listen to.
+
+        """
+        return sum([self.listen_misc, self.listen_aist, self.listen_ccrd])
+
+    @property
+    def n_rx_threads(self):
+        """
+        Returns
+        -------
+        int
+            Number of currently active receiving threads (the event loop
+            thread).
+
+        """
+        return int(self.thread.is_alive())
+
+    def wait_ready(self, timeout=None):
+        """
+        Wait until all sockets are open and the receiving sockets are bound.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum time to wait (seconds). If None, wait indefinitely.
+            The default is None.
+
+        Raises
+        ------
+        OSError
+            if a socket could not be opened (e.g. its port is in use).
+
+        Returns
+        -------
+        bool
+            True if all sockets are open, False if the wait timed out.
+
+        """
+        try:
+            self._started.result(timeout)
+        except TimeoutError:
+            return False
+
+        return True
+
+    def await_drain(self, timeout=None):
+        """
+        Wait until all messages handed over by the send methods before the
+        call have been passed to the kernel.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum time to wait (seconds). If None, wait indefinitely.
+            The default is None.
+
+        Returns
+        -------
+        bool
+            True if all messages have been sent, False if the wait timed out.
+
+        """
+        drained = asyncio.run_coroutine_threadsafe(self._drain(), self._loop)
+        try:
+            drained.result(timeout)
+        except TimeoutError:
+            return False
+
+        return True
+
+    def send_misc_iec_msg(self, msg_str):
+        """
+        Send an IEC 61162-450 message carrying a 'miscelaneous' sentence.
+
+        Message is sent to the ip_address and dest_port_misc specified during
+        the initialisation of the interface object, by the event loop thread.
+
+        Prints debugging output if self.verbosity > 1.
+
+        Parameters
+        ----------
+        msg_str : str or bytes-like
+            IEC 61162-450 message string (or its ASCII bytes).
+
+        Returns
+        -------
+        None.
+
+        """
+        self._loop.call_soon_threadsafe(
+            self._send_misc, [bytes(encode_msg(msg_str))])
+        self._log_send(self._misc_address, msg_str)
+
+    def send_misc_iec_msgs(self, msg_strs):
+        """
+        Send several IEC 61162-450 messages carrying 'miscelaneous' sentences.
+
+        The messages are sent, in order, to the ip_address and dest_port_misc
+        specified during the initialisation of the interface object, by the
+        event loop thread.
+
+        Prints debugging output if self.verbosity > 1.
+
+        Parameters
+        ----------
+        msg_strs : list of str or bytes
+            IEC 61162-450 message strings (or their ASCII bytes).
+
+        Returns
+        -------
+        None.
+
+        """
+        msgs = [bytes(encode_msg(msg_str)) for msg_str in msg_strs]
+        self._loop.call_soon_threadsafe(self._send_misc, msgs)
+
+        if self._log_send is not NULL_LOG:
+            for msg_str in msg_strs:
+                self._log_send(self._misc_address, msg_str)
+
+    def close(self):
+        """
+        Close all UDP sockets and stop the event loop thread.
+
+        Messages handed over by the send methods before the call are sent
+        first.
+
+        Returns
+        -------
+        None.
+
+        """
+        if self._loop.is_closed():
+            return
+
+        # Let _start() finish (or stop it), so that no socket is opened after
+        # the others have been closed. Its errors are reported by
+        # wait_ready().
+        try:
+            self._started.result(6)
+        except TimeoutError:
+            self._started.cancel()
+        except Exception:
+            pass
+
+        closed = asyncio.run_coroutine_threadsafe(self._close(), self._loop)
+        try:
+            closed.result(6)
+        except TimeoutError:
+            pass
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self.thread.join(6)
+        self._loop.close()
+
+    async def _start(self, rx_ports):
+        # Open the sending and receiving sockets (event loop thread)
+        loop = self._loop
+
+        try:
+            send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            if self.sndbuf_bytes is not None:
+                set_socket_buffer(
+                    send_sock, socket.SO_SNDBUF, self.sndbuf_bytes,
+                    self.verbosity)
+            setsockopt_best_effort(
+                send_sock, socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP,
+                int(self.ip_multicast_loop))
+            send_sock.setblocking(False)
+            send_sock.connect(self._misc_address)
+
+            endpoint = await loop.create_datagram_endpoint(
+                lambda: _UDPProtocol(NULL_LOG, self.verbosity),
+                sock=send_sock)
+            self._endpoints.append(endpoint + (None,))
+            self._send_transport = endpoint[0]
+        finally:
+            # Messages handed over so far are sent below, or dropped if the
+            # socket could not be opened (see wait_ready())
+            pending, self._pending_tx = self._pending_tx, None
+
+        self._send_misc(pending)
+
+        for port, recv_cbk in rx_ports:
+            # A function that does nothing rather than a check per datagram
+            handler = make_recv_handler(recv_cbk, self._log_recv) or NULL_LOG
+
+            endpoint = await loop.create_datagram_endpoint(
+                lambda handler=handler: _UDPProtocol(handler, self.verbosity),
+                sock=self._open_recv_socket(port))
+            self._endpoints.append(endpoint + (port,))
+
+    def _open_recv_socket(self, port):
+        """
+        Create a non-blocking UDP socket listening on a specified port.
+
+        Parameters
+        ----------
+        port : int
+            UDP port to listen on.
+
+        Returns
+        -------
+        socket.socket
+            Receiving socket.
+
+        """
+        udp_recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        try:
+            if self.rcvbuf_bytes is not None:
+                set_socket_buffer(
+                    udp_recv_sock, socket.SO_RCVBUF, self.rcvbuf_bytes,
+                    self.verbosity)
+
+            # Only receive multicast traffic for groups joined by this socket
+            # (none), rather than for all groups joined on the host (Linux
+            # only), unless requested
+            setsockopt_best_effort(
+                udp_recv_sock, socket.IPPROTO_IP, IP_MULTICAST_ALL,
+                int(self.ip_multicast_all))
+
+            # Let other sockets listen on the port too (where supported)
+            if self.reuse_port:
+                setsockopt_best_effort(
+                    udp_recv_sock, socket.SOL_SOCKET, SO_REUSEPORT, 1)
+
+            udp_recv_sock.setblocking(False)
+            udp_recv_sock.bind(("", port))
+        except OSError:
+            # Do not leave the socket to the garbage collector
+            udp_recv_sock.close()
+            raise
+
+        if self.verbosity > 0:
+            print("Listening to traffic on UDP port {:d} ... ".format(port),
+                  flush=True)
+
+        return udp_recv_sock
+
+    def _send_misc(self, msgs):
+        # Send datagrams through the connected sending socket (event loop
+        # thread). Datagrams the kernel cannot take immediately are buffered
+        # by the transport, and datagrams handed over before the socket is
+        # open are held until _start() has opened it.
+        if self._send_transport is None:
+            if self._pending_tx is not None:
+                self._pending_tx.extend(msgs)
+            return
+
+        if self._send_transport.is_closing():
+            return
+
+        for msg in msgs:
+            self._send_transport.sendto(msg)
+
+    async def _drain(self):
+        # Wait until the sending transport's buffer is empty (event loop
+        # thread). Messages handed over before this call have been passed to
+        # the transport by now, as callbacks run in order, unless they are
+        # held until the sending socket is open.
+        while self._pending_tx or (
+                self._send_transport is not None
+                and not self._send_transport.is_closing()
+                and self._send_transport.get_write_buffer_size() > 0):
+            await asyncio.sleep(0.001)
+
+    async def _close(self):
+        # Close all transports, once any buffered data has been sent (event
+        # loop thread)
+        for transport, _, _ in self._endpoints:
+            transport.close()
+
+        for _, protocol, port in self._endpoints:
+            await protocol.closed
+
+            if self.verbosity > 0 and port is not None:
+                print("UDP socket for port {:d} closed. ".format(port),
+                      flush=True)
@@ -27,18 +27,245 @@ limitations under the License.
 # %% Import Statements
 # =============================================================================
 # Built-in Modules ------------------------------------------------------------
+import binascii
 
 # Third-party Modules ---------------------------------------------------------
-from bitstring import BitStream
+from bitstring import Bits, BitStream
 
-# Local Modules ---------------------------------------------------------------
-from iec_61162.part_1.sentences import iec_checksum, iec_ascii_6b_to_8b
 
 
 # =============================================================================
 # %% Helper Functions
 # =============================================================================
+# Minimum sentence length (characters) for which the checksum is calculated
+# by folding, below which a byte-by-byte loop is faster
+_CHECKSUM_FOLD_MIN_LEN = 64
 
+def iec_checksum(s):
+    """
+    Calculate the checksum of a sentence as per IEC 61162-1.
+
+    The checksum is the XOR of all characters between (but excluding) the
+    leading '$' or '!' and the checksum delimiter '*'.
+
+    Parameters
+    ----------
+    s : str or bytes-like
+        Sentence string (or its ASCII bytes), starting with '$' or '!' and
+        without the checksum field.
+
+    Returns
+    -------
+    int
+        Checksum (0-255).
+
+    """
+    return _xor_reduce(s[1:])
+
+def _xor_reduce(s):
+    """
+    XOR all characters of a string together.
+
+    Long strings are not processed character by character. Instead, the
+    string is converted into a single integer, which is repeatedly folded
+    in half (XORing the upper half onto the lower half) until one 64-bit word
+    is left, so that the work is done by C-level integer operations. The
+    eight bytes of that word are then XORed together with three shifts
+    (SIMD within a register).
+
+    Parameters
+    ----------
+    s : str or bytes-like
+        ASCII string (or its bytes).
+
+    Returns
+    -------
+    int
+        XOR of all characters (0-255).
+
+    """
+    b = s.encode("ascii") if isinstance(s, str) else s
+    n = len(b)
+
+    if n < _CHECKSUM_FOLD_MIN_LEN:
+        checksum = 0
+        for c in b:
+            checksum ^= c
+        return checksum
+
+    x = int.from_bytes(b, "little")
+    while n > 8:
+        half_bits = ((n + 1) >> 1) << 3
+        x = (x >> half_bits) ^ (x & ((1 << half_bits) - 1))
+        n = (n + 1) >> 1
+
+    x ^= x >> 32
+    x ^= x >> 16
+    x ^= x >> 8
+
+    return x & 0xFF
+
+# Checksum field and sentence terminator for each checksum value
+_CHECKSUM_SUFFIX = [f"*{i:02X}\r\n" for i in range(256)]
+
+# Checksum contribution of each EDM sequence number (0-999)
+_SEQ_NR_XOR = [_xor_reduce(str(i)) for i in range(1000)]
+
+# 6-bit ASCII character for each 6-bit value as per IEC 61162-1, and Base64
+# character for each 6-bit value
+_SIXBIT_TO_ASCII = bytes(v + 48 if v < 40 else v + 56 for v in range(64))
+_SIXBIT_TO_BASE64 = (
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/")
+
+# Translation table from the Base64 alphabet to 6-bit ASCII characters: both
+# encode 6-bit values, but with different alphabets
+_BASE64_TO_IEC_6B_ASCII = bytes.maketrans(_SIXBIT_TO_BASE64, _SIXBIT_TO_ASCII)
+
+def _payload_to_bytes(payload, n_bits=None):
+    """
+    Get the bytes and the length in bits of a payload.
+
+    Parameters
+    ----------
+    payload : bitstring.Bits or bytes-like
+        Payload, as a bitstring (e.g. bitstring.BitStream) or as packed bits
+        in a bytes-like object (e.g. bytes, bytearray, numpy.uint8 array),
+        most significant bit first.
+    n_bits : int, optional
+        Length of a bytes-like payload (bits); any bits beyond it are
+        ignored. If None, all bits of the payload are used. Ignored for
+        bitstrings. The default is None.
+
+    Raises
+    ------
+    ValueError
+        if n_bits exceeds the size of the payload.
+
+    Returns
+    -------
+    data : bytes
+        Payload bytes, with any unused bits of the last byte cleared.
+    n_bits : int
+        Length of the payload (bits).
+
+    """
+    if isinstance(payload, Bits):
+        return payload.tobytes(), len(payload)
+
+    data = bytes(payload)
+    if n_bits is None:
+        return data, len(data) * 8
+
+    if not 0 <= n_bits <= len(data) * 8:
+        raise ValueError("n_bits exceeds the size of the payload!")
+
+    n_bytes, n_rem = divmod(n_bits, 8)
+    if n_rem:
+        last = data[n_bytes] & (0xFF << (8 - n_rem)) & 0xFF
+        return data[:n_bytes] + bytes((last,)), n_bits
+
+    return data[:n_bytes], n_bits
+
+# Zero padding completing a 3-byte group, by number of bytes in the last group
+_ZERO_PAD = (b"", b"\x00\x00", b"\x00")
+
+def iec_ascii_6b_to_8b(bs, n_fill_bits=0):
+    """
+    Encode a bitstream as a sequence of 6-bit ASCII characters, each
+    represented by the corresponding 8-bit ASCII character, as per IEC
+    61162-1 (6-bit values 0-39 map to '0'-'W', 40-63 to '`'-'w').
+
+    Parameters
+    ----------
+    bs : bitstring.BitStream
+        Bitstream.
+    n_fill_bits : int, optional
+        Number of zero fill bits to append to the bitstream, so that its
+        length becomes a multiple of 6 bits. The default is 0.
+
+    Raises
+    ------
+    ValueError
+        if the length of the bitstream plus fill bits is not a multiple of
+        6 bits.
+
+    Returns
+    -------
+    str
+        8-bit ASCII string.
+
+    """
+    return iec_ascii_6b_to_8b_batch([bs], [n_fill_bits])[0]
+
+def iec_ascii_6b_to_8b_batch(bs_list, fill_bits_list=None, n_bits_list=None):
+    """
+    Encode several bitstreams as sequences of 6-bit ASCII characters.
+
+    See iec_ascii_6b_to_8b().
+
+    Splitting 3-byte groups into four 6-bit values is the same operation as
+    in Base64 encoding, so all bitstreams are encoded together by a single
+    call to the C-level Base64 encoder, followed by a translation from the
+    Base64 to the IEC 61162-1 alphabet.
+
+    Parameters
+    ----------
+    bs_list : list of bitstring.BitStream or bytes-like
+        Bitstreams, or packed bits in bytes-like objects (most significant
+        bit first).
+    fill_bits_list : list of int, optional
+        Number of zero fill bits to append to each bitstream. If None, no
+        fill bits are appended. The default is None.
+    n_bits_list : list of int, optional
+        Length (bits) of each bytes-like item of bs_list; None entries (or
+        None) mean all bits are used. Ignored for bitstreams.
+        The default is None.
+
+    Raises
+    ------
+    ValueError
+        if the length of a bitstream plus fill bits is not a multiple of
+        6 bits.
+
+    Returns
+    -------
+    list of str
+        8-bit ASCII strings, one per bitstream.
+
+    """
+    if fill_bits_list is None:
+        fill_bits_list = [0] * len(bs_list)
+
+    if n_bits_list is None:
+        n_bits_list = [None] * len(bs_list)
+
+    chunks = []
+    starts = []
+    n_chars = []
+    start = 0
+    for bs, n_fill_bits, n_bits in zip(bs_list, fill_bits_list, n_bits_list):
+        data, n_bits = _payload_to_bytes(bs, n_bits)
+        n_bits += n_fill_bits
+        if n_bits % 6:
+            raise ValueError("Bitstream length must be a multiple of 6 bits!")
+
+        # Pad to a whole number of 3-byte (24-bit) groups, so that the Base64
+        # encoder does not append any padding characters and each bitstream
+        # starts on a 4-character boundary of the encoded output. The zero
+        # padding (including the cleared bits completing the last byte)
+        # provides the fill bits.
+        pad = _ZERO_PAD[len(data) % 3]
+        chunks.append(data)
+        chunks.append(pad)
+        starts.append(start)
+        n_chars.append(n_bits // 6)
+        start += (len(data) + len(pad)) // 3 * 4
+
+    b64 = binascii.b2a_base64(b"".join(chunks), newline=False).translate(
+        _BASE64_TO_IEC_6B_ASCII)
+
+    return [b64[start:start + n].decode("ascii")
+            for start, n in zip(starts, n_chars)]
 
 # =============================================================================
 # %% Sentence Definitions
@@ -91,6 +318,13 @@ class EDMSentence:
             n_fill_bits,
             talker_id="AI"):
 
+        # Cached sentence prefix (up to and including the destination ID
+        # field) and its contribution to the checksum, and cached sentence
+        # string; rebuilt on demand after any of their fields has changed
+        self._prefix = None
+        self._prefix_xor = 0
+        self._string = None
+
         # TODO: Add input checking / setters/getters
         self.seq_nr = seq_nr
         self.source_id = source_id
@@ -99,6 +333,45 @@ class EDMSentence:
         self.n_fill_bits = n_fill_bits
         self.talker_id = talker_id
 
+    @classmethod
+    def _from_trusted(
+            cls,
+            seq_nr,
+            source_id,
+            destination_id,
+            data,
+            n_fill_bits,
+            talker_id="AI",
+            string=None):
+        """
+        Create an EDM sentence from field values known to be valid, without
+        going through the property setters.
+
+        For use by generators that guarantee the field ranges themselves.
+        See EDMSentence for the parameters; string is the pre-built sentence
+        string, if already known (it must match the fields).
+
+        Returns
+        -------
+        vdes1000.sentences.EDMSentence
+            EDM sentence.
+
+        """
+        self = cls.__new__(cls)
+        self._prefix = None
+        self._prefix_xor = 0
+        self._string = string
+        self._seq_nr = seq_nr
+        self._source_id = source_id
+        self._src_str = str(source_id)
+        self._destination_id = destination_id
+        self._dst_str = str(destination_id)
+        self._data = data
+        self._n_fill_bits = n_fill_bits
+        self._talker_id = talker_id
+
+        return self
+
     @property
     def seq_nr(self):
         return self._seq_nr
@@ -107,9 +380,57 @@ class EDMSentence:
     def seq_nr(self, value):
         if 0 <= value <= 999:
             self._seq_nr = value
+            self._prefix = self._string = None
         else:
             raise ValueError("seq_nr must be between 0 and 999!")
 
+    @property
+    def source_id(self):
+        return self._source_id
+
+    @source_id.setter
+    def source_id(self, value):
+        self._source_id = value
+        self._src_str = str(value)
+        self._prefix = self._string = None
+
+    @property
+    def destination_id(self):
+        return self._destination_id
+
+    @destination_id.setter
+    def destination_id(self, value):
+        self._destination_id = value
+        self._dst_str = str(value)
+        self._prefix = self._string = None
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._string = None
+
+    @property
+    def n_fill_bits(self):
+        return self._n_fill_bits
+
+    @n_fill_bits.setter
+    def n_fill_bits(self, value):
+        self._n_fill_bits = value
+        self._string = None
+
+    @property
+    def talker_id(self):
+        return self._talker_id
+
+    @talker_id.setter
+    def talker_id(self, value):
+        self._talker_id = value
+        self._prefix = self._string = None
+
     @property
     def string(self):
         """
@@ -119,19 +440,23 @@ class EDMSentence:
             Sentence string, formatted as per the VDES1000 Datasheet v.6, 2023.
 
         """
-        s = "${:s}{:s},{:d},{:s},{:s},{:s},{:d}".format(
-            self.talker_id,
-            self.formatter_code,
-            self.seq_nr,
-            self.source_id if self.source_id == "" else str(self.source_id),
-            self.destination_id if self.destination_id == "" else str(self.destination_id),
-            self.data,
-            self.n_fill_bits)
+        if self._string is not None:
+            return self._string
+
+        if self._prefix is None:
+            self._prefix = (
+                f"${self._talker_id}{self.formatter_code},{self._seq_nr:d},"
+                f"{self._src_str},{self._dst_str},")
+            self._prefix_xor = iec_checksum(self._prefix)
+
+        # Only the variable tail of the sentence needs to be XORed, the
+        # checksum of the prefix is cached
+        tail = f"{self._data},{self._n_fill_bits:d}"
+        checksum = self._prefix_xor ^ _xor_reduce(tail)
 
-        checksum = iec_checksum(s)
-        s += "*" + "{:>02X}".format(checksum) + "\r\n"
+        self._string = f"{self._prefix}{tail}{_CHECKSUM_SUFFIX[checksum]}"
 
-        return s
+        return self._string
 
 #### Other Proprietary Sentences ----------------------------------------------
 
@@ -156,20 +481,27 @@ class SentenceGenerator:
             self,
             pi_data_payload_bs,
             destination_id,
-            talker_id="AI"):
+            talker_id="AI",
+            n_bits=None):
         """
         Generate an EDM sentence encapsulating a PI Data Payload bitstream.
 
         Parameters
         ----------
-        pi_data_payload_bs : bitstring.BitStream
-            PI Data Payload bitstream. Payload size currently limited by the
-            use of the CML-proprietary EDM sentence to 498 bytes (664 chars.).
+        pi_data_payload_bs : bitstring.BitStream or bytes-like
+            PI Data Payload bitstream, or the payload as packed bits in a
+            bytes-like object (e.g. bytes, bytearray, numpy.uint8 array),
+            which avoids the bitstring overhead. Payload size currently
+            limited by the use of the CML-proprietary EDM sentence to 498
+            bytes (664 chars.).
         destination_id : int
             Destination ID (10 digits as per the draft IEC VDES-ASM PAS; VDES1000
             currently only supports 9 digits). Null field implies broadcast.
         talker_id : str, optional
             Talker ID. The default is "AI".
+        n_bits : int, optional
+            Length of a bytes-like payload (bits). If None, all bits are used.
+            Ignored for bitstreams. The default is None.
 
         Returns
         -------
@@ -178,15 +510,67 @@ class SentenceGenerator:
             bitstream.
 
         """
-        n_bits = len(pi_data_payload_bs)
+        return self.generate_edm_batch(
+            [pi_data_payload_bs],
+            destination_id,
+            talker_id,
+            None if n_bits is None else [n_bits])
+
+    def generate_edm_batch(
+            self,
+            payload_list,
+            destination_id,
+            talker_id="AI",
+            n_bits_list=None):
+        """
+        Generate EDM sentences encapsulating several PI Data Payload
+        bitstreams.
+
+        The 6-bit ASCII encoding of all payloads is done in one go; the
+        payloads are assigned consecutive sequence numbers. No sentences are
+        generated (and the sequence number is not advanced) if any of the
+        payloads is too large.
 
-        # Pad the payload with fill bits
-        n_fill_bits = int((6 - (n_bits % 6)) % 6)
-        padded_payload_bs = pi_data_payload_bs + BitStream(n_fill_bits)
+        Parameters
+        ----------
+        payload_list : list of bitstring.BitStream or bytes-like
+            PI Data Payload bitstreams (or bytes-like payloads).
+            See generate_edm().
+        destination_id : int
+            Destination ID (10 digits as per the draft IEC VDES-ASM PAS; VDES1000
+            currently only supports 9 digits). Null field implies broadcast.
+        talker_id : str, optional
+            Talker ID. The default is "AI".
+        n_bits_list : list of int, optional
+            Length (bits) of each bytes-like payload; None entries (or None)
+            mean all bits are used. See generate_edm(). The default is None.
 
-        # Encode the payload as a sequence of 8-bit ASCII characters, each
-        # corresponding to one 6-bit ASCII character
-        pi_data_payload_str = iec_ascii_6b_to_8b(padded_payload_bs)
+        Returns
+        -------
+        list of lists of vdes1000.sentences.EDMSentence
+            List of lists of EDM sentences, one list per PI Data Payload.
+
+        """
+        if n_bits_list is None:
+            n_bits_list = [None] * len(payload_list)
+
+        # Get the payloads as bytes, so that bitstreams are only unpacked
+        # once, and the number of fill bits needed to complete the last 6-bit
+        # character of each payload
+        data_list = []
+        data_n_bits = []
+        fill_bits = []
+        for payload, n_bits in zip(payload_list, n_bits_list):
+            data, n_bits = _payload_to_bytes(payload, n_bits)
+            data_list.append(data)
+            data_n_bits.append(n_bits)
+            fill_bits.append(-n_bits % 6)
+
+        # Encode the payloads (padded with the fill bits) as sequences of
+        # 8-bit ASCII characters, each corresponding to one 6-bit ASCII
+        # character
+        payload_strings = iec_ascii_6b_to_8b_batch(
+            data_list, fill_bits, data_n_bits)
 
         # Maximum data size for the EDM sentence. The data size is constrained
         # by the payload limit of a VDE data session when using the lowest data
@@ -194,21 +578,40 @@ class SentenceGenerator:
         # sessions.
         max_edm_data_char = 664
 
-        if len(pi_data_payload_str) > max_edm_data_char:
-            raise ValueError("Size of the PI Data Payload exceeds the currently supported maximum.")
-
-        edm_sentence = EDMSentence(
-            seq_nr=self.edm_seq_nr,
-            source_id="",
-            destination_id=destination_id,
-            data=pi_data_payload_str,
-            n_fill_bits=n_fill_bits,
-            talker_id=talker_id)
-
-        # Increase seq_nr and roll over after 999
-        self.edm_seq_nr = (self.edm_seq_nr + 1) % 1000
-
-        return [[edm_sentence]]
+        for pi_data_payload_str in payload_strings:
+            if len(pi_data_payload_str) > max_edm_data_char:
+                raise ValueError("Size of the PI Data Payload exceeds the currently supported maximum.")
+
+        # The sentence strings are built here in one go, rather than by the
+        # sentences: the fields around the sequence number are the same for
+        # all sentences of the batch, so their checksum is calculated once
+        head = f"${talker_id}{EDMSentence.formatter_code},"
+        mid = f",,{destination_id},"
+        fixed_xor = iec_checksum(head) ^ _xor_reduce(mid)
+
+        sentence_groups = []
+        for pi_data_payload_str, n_fill_bits in zip(payload_strings, fill_bits):
+            seq_nr = self.edm_seq_nr
+            tail = f"{pi_data_payload_str},{n_fill_bits:d}"
+            checksum = fixed_xor ^ _SEQ_NR_XOR[seq_nr] ^ _xor_reduce(tail)
+
+            # The sequence number is kept in range by the roll-over below
+            edm_sentence = EDMSentence._from_trusted(
+                seq_nr=seq_nr,
+                source_id="",
+                destination_id=destination_id,
+                data=pi_data_payload_str,
+                n_fill_bits=n_fill_bits,
+                talker_id=talker_id,
+                string=(f"{head}{seq_nr:d}{mid}{tail}"
+                        f"{_CHECKSUM_SUFFIX[checksum]}"))
+
+            sentence_groups.append([edm_sentence])
+
+            # Increase seq_nr and roll over after 999
+            self.edm_seq_nr = (self.edm_seq_nr + 1) % 1000
+
+        return sentence_groups
 
 # =============================================================================
 # %% Sentence Parsing
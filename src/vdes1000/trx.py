@@ -26,7 +26,7 @@ limitations under the License.
 # %% Import Statements
 # =============================================================================
 # Built-in Modules ------------------------------------------------------------
-import time
+from threading import Event
 
 # Third-party Modules ---------------------------------------------------------
 
@@ -36,7 +36,24 @@ from iec_62320.part_1.sentences import SentenceGenerator as AISBaseSentenceGener
 from iec_pas_63343.sentences import SentenceGenerator as ASMSentenceGenerator
 from vdes1000.sentences import SentenceGenerator as VDESentenceGenerator
 from iec_61162.part_450.messages import MessageGenerator
-from vdes1000.udp import UDPInterface
+from vdes1000.udp import DEFAULT_SOCKET_BUFFER_BYTES, UDPInterface
+from vdes1000.utils import to_namespace
+
+# =============================================================================
+# %% Constants
+# =============================================================================
+# Channel values accepted by the send methods, mapped onto sentence fields
+_AIS_CHANNEL_MAP = {"AIS 1": "A", "AIS 2": "B"}
+
+_BBM_CHANNEL_MAP = {"no preference": 0,
+                    "AIS 1": 1,
+                    "AIS 2": 2,
+                    "both": 3}
+
+_ASM_CHANNEL_MAP = {"no preference": 0,
+                    "ASM 1": 1,
+                    "ASM 2": 2,
+                    "both": 3}
 
 # =============================================================================
 # %% Function Definitions
@@ -52,8 +69,9 @@ class VDESTransceiver():
 
     Parameters
     ----------
-    cfg : dict
-        Transceiver configuration. See vdes_trx_X.yaml
+    cfg : dict or types.SimpleNamespace
+        Transceiver configuration. See vdes_trx_X.yaml and
+        vdes1000.utils.to_namespace().
     recv_cbk_misc : function, optional
         Receive event callback function for dest_port_misc.
 
@@ -61,7 +79,7 @@ class VDESTransceiver():
 
         address : tuple, (ip_address, port)
             Source address.
-        data : str
+        data : bytes
             Received data.
 
         The default is None.
@@ -70,6 +88,13 @@ class VDESTransceiver():
         See also recv_cbk_misc.
         The default is None.
 
+    Attributes
+    ----------
+    response_event : threading.Event
+        Cleared by each send_* method and set when data (e.g. an
+        acknowledgement) is next received from the VDES1000 on
+        dest_port_misc. See wait_for_response().
+
     Returns
     -------
     None.
@@ -79,6 +104,16 @@ class VDESTransceiver():
         # Store configuration
         self.cfg = cfg
 
+        # Store the user's receive callback for dest_port_misc, which is
+        # called by self._recv_misc()
+        self.recv_cbk_misc = recv_cbk_misc
+
+        # Set when responses are received on dest_port_misc
+        self.response_event = Event()
+
+        # Attribute-style view of the user configuration items
+        user_cfg = to_namespace(cfg).user
+
         # Initialise an AIS Base Statopm Sentence Generator
         self.ais_base_sg = AISBaseSentenceGenerator()
 
@@ -93,26 +128,99 @@ class VDESTransceiver():
 
         # Initialise an IEC 61162-450 Message Generator
         self.iec_61162_450_mg = MessageGenerator(
-            source_id=cfg["user"]["talker_id"])
+            source_id=user_cfg.talker_id)
 
         # Initialise a VDES1000 UDP interface
         self.udp_interface = UDPInterface(
-            ip_address=cfg["user"]["ip_address"],
-            dest_port_misc=cfg["user"]["dest_port_misc"],
-            dest_port_aist=cfg["user"]["dest_port_aist"],
-            dest_port_ccrd=cfg["user"]["dest_port_ccrd"],
-            listen_misc=cfg["user"]["listen_misc"],
-            listen_aist=cfg["user"]["listen_aist"],
-            listen_ccrd=cfg["user"]["listen_ccrd"],
-            recv_cbk_misc=recv_cbk_misc,
+            ip_address=user_cfg.ip_address,
+            dest_port_misc=user_cfg.dest_port_misc,
+            dest_port_aist=user_cfg.dest_port_aist,
+            dest_port_ccrd=user_cfg.dest_port_ccrd,
+            listen_misc=user_cfg.listen_misc,
+            listen_aist=user_cfg.listen_aist,
+            listen_ccrd=user_cfg.listen_ccrd,
+            recv_cbk_misc=self._recv_misc,
             recv_cbk_aist=recv_cbk_aist,
-            buffer_size=cfg["user"]["udp_buffer_size"],
-            verbosity=cfg["user"]["udp_verbosity"])
+            buffer_size=user_cfg.udp_buffer_size,
+            sndbuf_bytes=getattr(
+                user_cfg, "udp_sndbuf_bytes", DEFAULT_SOCKET_BUFFER_BYTES),
+            rcvbuf_bytes=getattr(
+                user_cfg, "udp_rcvbuf_bytes", DEFAULT_SOCKET_BUFFER_BYTES),
+            n_listen_sockets_per_port=getattr(
+                user_cfg, "n_listen_sockets_per_port", 1),
+            reuse_port=getattr(user_cfg, "udp_reuse_port", False),
+            ip_multicast_all=getattr(user_cfg, "udp_ip_multicast_all", False),
+            ip_multicast_loop=getattr(
+                user_cfg, "udp_ip_multicast_loop", False),
+            recv_queue_size=getattr(user_cfg, "udp_recv_queue_size", None),
+            rx_cpu_affinity=getattr(user_cfg, "rx_cpu_affinity", None),
+            tx_thread=getattr(user_cfg, "udp_tx_thread", False),
+            share_listen_sockets=getattr(
+                user_cfg, "udp_share_listen_sockets", False),
+            verbosity=user_cfg.udp_verbosity)
+
+        # Wait for the UDP receiving threads to start listening, and do not
+        # carry on without them (e.g. if a port is in use)
+        try:
+            ready = self.udp_interface.wait_ready(timeout=10)
+        except OSError:
+            self.udp_interface.close()
+            raise
+
+        if not ready:
+            self.udp_interface.close()
+            raise TimeoutError(
+                "The UDP interface did not start listening within 10 s!")
+
+    def _recv_misc(self, address, data):
+        """
+        Receive event callback for dest_port_misc.
+
+        Calls the user's callback (if any), then sets self.response_event.
+
+        Passed to the UDP interface even if the user gave no callback, so
+        that wait_for_response() works. Each datagram received on
+        dest_port_misc is therefore copied to bytes (and, if
+        udp_recv_queue_size is set, goes through the receive queue); the
+        misc port carries little traffic (mostly responses), so this is
+        preferred to a separate path for response waits.
+
+        Parameters
+        ----------
+        address : tuple, (ip_address, port)
+            Source address.
+        data : bytes
+            Received data (a copy, which the user's callback may retain).
+
+        Returns
+        -------
+        None.
+
+        """
+        if self.recv_cbk_misc is not None:
+            self.recv_cbk_misc(address, data)
+
+        self.response_event.set()
+
+    def wait_for_response(self, timeout=None):
+        """
+        Wait until the VDES1000 responds to the last transmission request.
+
+        Only works if listening on dest_port_misc is enabled.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum time to wait (seconds). If None, wait indefinitely.
+            The default is None.
+
+        Returns
+        -------
+        bool
+            True if a response was received, False if the wait timed out.
 
-        # Wait for the UDP receiving threads to start
-        while (self.udp_interface.n_rx_threads <
-               self.udp_interface.n_listening_ports):
-            time.sleep(1)
+        """
+        return self.response_event.wait(timeout)
 
     def send_ais_msg(
             self,
@@ -161,15 +269,13 @@ class VDESTransceiver():
         None.
 
         """
-        channel_dict = {"AIS 1": "A", "AIS 2": "B"}
-
-        if channel not in channel_dict:
+        if channel not in _AIS_CHANNEL_MAP:
             raise ValueError("Unknown channel value.")
 
         # Send the message down the presentation layer
         sentences = self.ais_base_sg.generate_tsa_vdm(
             msg_bs=msg_bs,
-            channel=channel_dict[channel],
+            channel=_AIS_CHANNEL_MAP[channel],
             unique_id=unique_id,
             utc_hhmm=utc_hhmm,
             start_slot=start_slot,
@@ -179,8 +285,9 @@ class VDESTransceiver():
         iec_messages = self.iec_61162_450_mg.generate_msg(sentences)
 
         # Send the IEC 61162-450 Messages via UDP to the VDES1000
-        for msg in iec_messages:
-            self.udp_interface.send_misc_iec_msg(msg.string)
+        self.response_event.clear()
+        self.udp_interface.send_misc_iec_msgs(
+            [msg.string for msg in iec_messages])
 
     def send_ais_binary_broadcast(
             self,
@@ -229,12 +336,7 @@ class VDESTransceiver():
         None.
 
         """
-        channel_dict = {"no preference": 0,
-                        "AIS 1": 1,
-                        "AIS 2": 2,
-                        "both": 3}
-
-        if channel not in channel_dict:
+        if channel not in _BBM_CHANNEL_MAP:
             raise ValueError("Unknown channel value!")
 
         # Check that the ASM payload won't require more than 3 AIS time
@@ -246,15 +348,16 @@ class VDESTransceiver():
         # Send the ASM payload through the PL processing
         sentences = self.ais_mob_sg.generate_bbm(
             asm_payload_bs=asm_payload_bs,
-            channel=channel_dict[channel],
+            channel=_BBM_CHANNEL_MAP[channel],
             msg_id=msg_id)
 
         # Send the sentences through the IEC 61162-450 processing
         iec_messages = self.iec_61162_450_mg.generate_msg(sentences)
 
         # Send the IEC 61162-450 Messages via UDP to the VDES1000
-        for msg in iec_messages:
-            self.udp_interface.send_misc_iec_msg(msg.string)
+        self.response_event.clear()
+        self.udp_interface.send_misc_iec_msgs(
+            [msg.string for msg in iec_messages])
 
     def send_asm_broadcast(
             self,
@@ -297,34 +400,30 @@ class VDESTransceiver():
         None.
 
         """
-
-        channel_dict = {"no preference": 0,
-                        "ASM 1": 1,
-                        "ASM 2": 2,
-                        "both": 3}
-
-        if channel not in channel_dict:
+        if channel not in _ASM_CHANNEL_MAP:
             raise ValueError("Unknown channel value!")
 
         # Send the ASM payload through the PL processing
         sentences = self.asm_sg.generate_abb(
             asm_payload_bs=asm_payload_bs,
             source_id=source_id,
-            channel=channel_dict[channel],
+            channel=_ASM_CHANNEL_MAP[channel],
             transmission_format=transmission_format)
 
         # Send the sentences through the IEC 61162-450 processing
         iec_messages = self.iec_61162_450_mg.generate_msg(sentences)
 
         # Send the IEC 61162-450 Messages via UDP to the VDES1000
-        for msg in iec_messages:
-            self.udp_interface.send_misc_iec_msg(msg.string)
+        self.response_event.clear()
+        self.udp_interface.send_misc_iec_msgs(
+            [msg.string for msg in iec_messages])
 
 
     def send_vde_data(
             self,
             pi_data_payload_bs,
-            destination_id):
+            destination_id,
+            n_bits=None):
         """
         Send data over VDE.
 
@@ -335,11 +434,15 @@ class VDESTransceiver():
 
         Parameters
         ----------
-        pi_data_payload_bs : bitstring.BitStream
-            PI Data Payload bitstream.
+        pi_data_payload_bs : bitstring.BitStream or bytes-like
+            PI Data Payload bitstream, or the payload as packed bits in a
+            bytes-like object (e.g. bytes, numpy.uint8 array).
         destination_id : int
             Destination ID (VDES1000 currently only supports 9 digits but
             should be 10 digits as per the draft IEC VDES-ASM PAS).
+        n_bits : int, optional
+            Length of a bytes-like payload (bits). If None, all bits are used.
+            Ignored for bitstreams. The default is None.
 
         Returns
         -------
@@ -349,14 +452,57 @@ class VDESTransceiver():
         # Send the payload down the Presentation Layer
         sentences = self.vde_sg.generate_edm(
             pi_data_payload_bs=pi_data_payload_bs,
-            destination_id=destination_id)
+            destination_id=destination_id,
+            n_bits=n_bits)
+
+        # Send the sentences through the IEC 61162-450 processing
+        iec_messages = self.iec_61162_450_mg.generate_msg(sentences)
+
+        # Send the IEC 61162-450 Messages via UDP to the VDES1000
+        self.response_event.clear()
+        self.udp_interface.send_misc_iec_msgs(
+            [msg.string for msg in iec_messages])
+
+    def send_vde_data_batch(
+            self,
+            payload_list,
+            destination_id,
+            n_bits_list=None):
+        """
+        Send several PI Data Payloads over VDE.
+
+        Equivalent to calling send_vde_data() for each payload, but the EDM
+        sentences for all payloads are generated in one go.
+
+        Parameters
+        ----------
+        payload_list : list of bitstring.BitStream or bytes-like
+            PI Data Payload bitstreams (or bytes-like payloads).
+        destination_id : int
+            Destination ID (VDES1000 currently only supports 9 digits but
+            should be 10 digits as per the draft IEC VDES-ASM PAS).
+        n_bits_list : list of int, optional
+            Length (bits) of each bytes-like payload. If None, all bits are
+            used. See send_vde_data(). The default is None.
+
+        Returns
+        -------
+        None.
+
+        """
+        # Send the payloads down the Presentation Layer
+        sentences = self.vde_sg.generate_edm_batch(
+            payload_list=payload_list,
+            destination_id=destination_id,
+            n_bits_list=n_bits_list)
 
         # Send the sentences through the IEC 61162-450 processing
         iec_messages = self.iec_61162_450_mg.generate_msg(sentences)
 
         # Send the IEC 61162-450 Messages via UDP to the VDES1000
-        for msg in iec_messages:
-            self.udp_interface.send_misc_iec_msg(msg.string)
+        self.response_event.clear()
+        self.udp_interface.send_misc_iec_msgs(
+            [msg.string for msg in iec_messages])
 
 # =============================================================================
 # %% Quick & Dirty Testing
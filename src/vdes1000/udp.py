@@ -2,7 +2,7 @@
 """
 UDP Interface Module.
 
-This module provides a class designed to manage communications
+This module provides classes designed to manage communications
 with the VDES1000 transceiver over UDP.
 
 @author: Jan Safar
@@ -25,18 +25,1073 @@ limitations under the License.
 # =============================================================================
 # %% Import Statements
 # =============================================================================
+import ctypes
+import ctypes.util
+import errno
+import os
+import selectors
 import socket
-from threading import Thread
-from vdes1000.utils import ts_print as print
+import struct
+import sys
+import time
+from collections import deque
+from queue import SimpleQueue
+from threading import Condition, Event, Lock, Thread, current_thread
+from vdes1000.utils import NULL_LOG, ts_print as print, ts_print_async
 
 # =============================================================================
 # %% Function Definitions
 # =============================================================================
+#### Socket Options ----------------------------------------------------------
+# IP_MULTICAST_ALL socket option (Linux), not exposed by the socket module
+IP_MULTICAST_ALL = getattr(
+    socket,
+    "IP_MULTICAST_ALL",
+    49 if sys.platform.startswith("linux") else None)
+
+# SO_REUSEPORT socket option, not available on all platforms (e.g. Windows)
+SO_REUSEPORT = getattr(socket, "SO_REUSEPORT", None)
+
+# Default kernel send/receive buffer size (bytes), large enough to absorb
+# bursts while the Python threads are busy (or waiting for the GIL)
+DEFAULT_SOCKET_BUFFER_BYTES = 4 * 1024 * 1024
+
+def setsockopt_best_effort(sock, level, option, value):
+    """
+    Set a socket option, ignoring platforms that do not support it.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Socket.
+    level : int
+        Protocol level (e.g. socket.IPPROTO_IP).
+    option : int or None
+        Socket option. If None (not defined on this platform), nothing is
+        done.
+    value : int
+        Option value.
+
+    Returns
+    -------
+    bool
+        True if the option was set, False otherwise.
+
+    """
+    if option is None:
+        return False
+
+    try:
+        sock.setsockopt(level, option, value)
+    except OSError:
+        return False
+
+    return True
+
+def set_socket_buffer(sock, option, n_bytes, verbosity=0):
+    """
+    Set the size of a socket's kernel send or receive buffer, and check the
+    size actually granted.
+
+    Prints a warning if the size was capped and verbosity > 0.
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Socket.
+    option : int
+        socket.SO_SNDBUF or socket.SO_RCVBUF.
+    n_bytes : int
+        Requested buffer size (bytes).
+    verbosity : int, optional
+        Verbosity level. The default is 0.
+
+    Returns
+    -------
+    int
+        Effective buffer size (bytes).
+
+    """
+    sock.setsockopt(socket.SOL_SOCKET, option, n_bytes)
+
+    # Linux doubles the requested value to allow for bookkeeping overhead and
+    # reports the doubled value
+    effective = sock.getsockopt(socket.SOL_SOCKET, option)
+    if sys.platform.startswith("linux"):
+        effective //= 2
+
+    if effective < n_bytes and verbosity > 0:
+        if option == socket.SO_RCVBUF:
+            name, sysctl = "SO_RCVBUF", "net.core.rmem_max"
+        else:
+            name, sysctl = "SO_SNDBUF", "net.core.wmem_max"
+        print("Warning: {:s} capped to {:d} bytes ({:d} requested); "
+              "consider raising {:s}.".format(name, effective, n_bytes, sysctl),
+              flush=True)
+
+    return effective
+
+#### Linux UDP Generic Segmentation Offload ----------------------------------
+# UDP_SEGMENT socket option/control message (Linux 4.18+), not exposed by the
+# socket module
+_UDP_SEGMENT = getattr(
+    socket,
+    "UDP_SEGMENT",
+    103 if sys.platform.startswith("linux") else None)
+
+# Kernel limits for a single GSO send
+_UDP_GSO_MAX_SEGMENTS = 64
+_UDP_GSO_MAX_BYTES = 65507
+
+# UDP_SEGMENT control message data (segment size, native byte order)
+_UDP_SEGMENT_STRUCT = struct.Struct("=H")
+
+#### Linux sendmmsg()/recvmmsg() Bindings ------------------------------------
+class _IOVec(ctypes.Structure):
+    _fields_ = [
+        ("iov_base", ctypes.c_void_p),
+        ("iov_len", ctypes.c_size_t)]
+
+class _MsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_IOVec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int)]
+
+class _MMsgHdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_hdr", _MsgHdr),
+        ("msg_len", ctypes.c_uint)]
+
+def _load_libc_function(name, argtypes):
+    """
+    Look up a (Linux) function in the C library.
+
+    Parameters
+    ----------
+    name : str
+        Function name.
+    argtypes : list of ctypes types
+        Argument types. The return type is int.
+
+    Returns
+    -------
+    function or None
+        The foreign function, or None if not available on this platform.
+
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+
+    try:
+        libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6",
+            use_errno=True)
+        func = getattr(libc, name)
+    except (OSError, AttributeError):
+        return None
+
+    func.argtypes = argtypes
+    func.restype = ctypes.c_int
+
+    return func
+
+_sendmmsg = _load_libc_function(
+    "sendmmsg",
+    [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int])
+
+_recvmmsg = _load_libc_function(
+    "recvmmsg",
+    [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int,
+     ctypes.c_void_p])
+
+def _sendmmsg_all(fd, mmsgs, n):
+    """
+    Send the first n messages of an mmsghdr array, retrying until all of them
+    have been accepted by the kernel.
+
+    Parameters
+    ----------
+    fd : int
+        Socket file descriptor.
+    mmsgs : ctypes array of _MMsgHdr
+        Message headers.
+    n : int
+        Number of messages to send.
+
+    Raises
+    ------
+    OSError
+        if sendmmsg() fails.
+
+    Returns
+    -------
+    None.
+
+    """
+    base = ctypes.addressof(mmsgs)
+    size = ctypes.sizeof(_MMsgHdr)
+    i = 0
+    while i < n:
+        ret = _sendmmsg(fd, base + i * size, n - i, 0)
+        if ret < 0:
+            err = ctypes.get_errno()
+            if err == errno.EINTR:
+                continue
+            raise OSError(err, os.strerror(err))
+        i += ret
+
+
+#### Message Encoding --------------------------------------------------------
+def encode_msg(msg_str):
+    """
+    Encode an IEC 61162-450 message string for sending.
+
+    Sentences are ASCII, so the (plain copy) ASCII codec is tried first,
+    falling back to UTF-8. Bytes-like messages are returned as they are.
+
+    Parameters
+    ----------
+    msg_str : str or bytes-like
+        IEC 61162-450 message string (or its ASCII bytes).
+
+    Returns
+    -------
+    bytes-like
+        Encoded message.
+
+    """
+    if not isinstance(msg_str, str):
+        return msg_str
+
+    try:
+        return msg_str.encode("ascii")
+    except UnicodeEncodeError:
+        return msg_str.encode()
+
+
+#### Debugging Output --------------------------------------------------------
+def make_data_logger(verbosity, event, format_data):
+    """
+    Create a function printing debugging output for sent/received data.
+
+    The verbosity is resolved once, so that the returned function does not
+    branch (or build strings) on every datagram, and is a no-op if
+    verbosity < 2. The output is queued with ts_print_async(), so that the
+    sending and receiving threads never wait for it to be printed.
+
+    Parameters
+    ----------
+    verbosity : int
+        Verbosity level. The address is printed if verbosity > 1, the data
+        too if verbosity > 2.
+    event : str
+        Description of the event, e.g. "sent to".
+    format_data : function
+        Converts the data into a printable str.
+
+    Returns
+    -------
+    log : function
+        Expected arguments: address, tuple (ip_address, port); data.
+
+    """
+    if verbosity > 2:
+        def log(address, data):
+            ts_print_async("\nData {:s} {:s}:{:d}:\n{:s}".format(
+                event, address[0], address[1], format_data(data)))
+    elif verbosity > 1:
+        def log(address, data):
+            ts_print_async("\nData {:s} {:s}:{:d}".format(
+                event, address[0], address[1]))
+    else:
+        log = NULL_LOG
+
+    return log
+
+
+def make_recv_handler(recv_cbk, log_recv):
+    """
+    Combine a receive callback and a received data logger into the single
+    function to call per received datagram.
+
+    Parameters
+    ----------
+    recv_cbk : function or None
+        Receive event callback function.
+    log_recv : function
+        Received data logger (see make_data_logger()).
+
+    Returns
+    -------
+    function or None
+        Expected arguments: address, tuple (ip_address, port); data. None if
+        there is nothing to do with received data.
+
+    """
+    if log_recv is NULL_LOG:
+        return recv_cbk
+
+    if recv_cbk is None:
+        return log_recv
+
+    def handle(address, data):
+        log_recv(address, data)
+        recv_cbk(address, data)
+
+    return handle
+
+def decode_data(data):
+    """Decode received data (bytes or memoryview) for debugging output."""
+    return bytes(data).decode("utf-8", errors="replace")
+
+
+#### Receiving Threads -------------------------------------------------------
+# Maximum number of datagrams received with one recvmmsg() call
+_RX_BATCH = 32
+
+# Maximum number of consecutive batches received from a socket per wake-up:
+# while full batches are returned, more datagrams are likely waiting, and
+# are received without another selector system call; the limit keeps a busy
+# port from starving the others served by the same thread
+_RX_MAX_BATCHES = 8
+
+# Port field of a sockaddr_in structure (network byte order)
+_SOCKADDR_IN_PORT_STRUCT = struct.Struct("!H")
+
+#### Shared Receiving Sockets -----------------------------------------------
+# Receiving sockets shared by UDPInterface objects (see _SharedRxSocket), by
+# port, and the lock guarding them and their listeners
+_SHARED_RX_SOCKETS = {}
+_SHARED_RX_SOCKETS_LOCK = Lock()
+
+def _attach_shared_rx_socket(port, interface, listener):
+    """
+    Add a listener to the shared receiving socket for a port, creating the
+    socket (using the settings of interface) if there is none yet, or if the
+    receiving thread of the existing one has stopped on an error.
+
+    Parameters
+    ----------
+    port : int
+        UDP port.
+    interface : UDPInterface
+        Interface the listener belongs to.
+    listener : tuple, (recv_cbk, copy, log_recv)
+        See _SharedRxSocket.
+
+    Returns
+    -------
+    shared_sock : _SharedRxSocket
+        Shared receiving socket the listener was added to.
+
+    """
+    with _SHARED_RX_SOCKETS_LOCK:
+        shared_sock = _SHARED_RX_SOCKETS.get(port)
+        # A failed socket has been closed, so the port can be bound again.
+        # It is left to its listeners, which detach from it when closed.
+        if shared_sock is None or shared_sock.error is not None:
+            shared_sock = _SHARED_RX_SOCKETS[port] = _SharedRxSocket(
+                port, interface)
+        shared_sock.add_listener(listener)
+
+    return shared_sock
+
+def _detach_shared_rx_socket(shared_sock, listener):
+    """
+    Remove a listener from a shared receiving socket, closing the socket once
+    it has no listeners left.
+
+    Parameters
+    ----------
+    shared_sock : _SharedRxSocket
+        Shared receiving socket returned by _attach_shared_rx_socket().
+    listener : tuple
+        Listener passed to _attach_shared_rx_socket().
+
+    Returns
+    -------
+    None.
+
+    """
+    # The lock is held while closing, so that the port is free again before
+    # another interface may try to listen on it
+    with _SHARED_RX_SOCKETS_LOCK:
+        if shared_sock.remove_listener(listener) == 0:
+            if _SHARED_RX_SOCKETS.get(shared_sock.port) is shared_sock:
+                del _SHARED_RX_SOCKETS[shared_sock.port]
+            shared_sock.close()
+
+
+#### Sending ----------------------------------------------------------------
+# Number of message headers pre-allocated for sending lists of datagrams with
+# sendmmsg() (longer lists are sent in several calls)
+_TX_SENDMMSG_POOL = 16
+
+# Maximum number of queued send requests coalesced into one batch by the
+# sending thread
+_TX_MAX_BATCH = 64
 
 
 # =============================================================================
 # %% Class Definitions
 # =============================================================================
+class SendmmsgBatcher():
+    """
+    A class to coalesce datagrams sent through a connected UDP socket.
+
+    Datagrams are copied into a pool of pre-allocated buffers and sent
+    together, using a single sendmmsg() system call where available (Linux),
+    once batch_size datagrams are queued or max_delay seconds after the first
+    datagram of a batch was queued, whichever comes first. On other platforms,
+    the datagrams of a batch are sent one by one.
+
+    Optionally (gso=True, Linux only), a batch in which all datagrams have
+    the same size (except for the last one, which may be shorter) is passed
+    to the kernel as a single UDP generic segmentation offload (GSO) send,
+    which the kernel splits back into the individual datagrams. Other batches
+    are sent as described above. If the kernel rejects GSO sends, GSO is
+    disabled for the remaining lifetime of the batcher.
+
+    Datagrams refused by the destination (nothing listening) are dropped, as
+    they would be with an unconnected socket.
+
+    Batches not filled within max_delay are sent by a flushing thread,
+    started with the batcher and waiting for the deadline of the current
+    batch, rather than by a timer started for every batch.
+
+    Call close() before closing the socket to send any queued datagrams,
+    stop the flushing thread and release the socket's file descriptor, which
+    is cached by the batcher.
+
+    The methods of this class are thread-safe: a lock serialises access to
+    the buffer pool and the message headers, covering both queuing and
+    flushing, so send() may be called from several threads concurrently
+    (e.g. from receive callbacks of a UDPInterface with several receiving
+    sockets per port).
+
+    Parameters
+    ----------
+    sock : socket.socket
+        Connected UDP socket.
+    batch_size : int, optional
+        Maximum number of datagrams per batch. The default is 16.
+    max_delay : float, optional
+        Maximum time a datagram is held in the queue (seconds).
+        The default is 0.002.
+    buffer_size : int, optional
+        Maximum datagram size (bytes). The default is 65535.
+    gso : bool, optional
+        Use UDP generic segmentation offload for batches of equally sized
+        datagrams where supported. The default is False.
+
+    """
+    def __init__(
+            self,
+            sock,
+            batch_size=16,
+            max_delay=0.002,
+            buffer_size=65535,
+            gso=False):
+        self.sock = sock
+        self._fd = sock.fileno()
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.buffer_size = buffer_size
+        self.gso = gso and _UDP_SEGMENT is not None
+
+        # Buffer pool - one buffer per datagram in a batch
+        self._bufs = [bytearray(buffer_size) for _ in range(batch_size)]
+        self._mvs = [memoryview(buf) for buf in self._bufs]
+        self._lens = [0] * batch_size
+        self._n = 0
+
+        self._lock = Lock()
+
+        # Flushing thread, sending each batch once its deadline has passed.
+        # It is only woken up when the first datagram of a batch is queued
+        # while it is idle (no batch pending), so bursts do not wake it for
+        # every batch.
+        self._cond = Condition(self._lock)
+        self._deadline = None
+        self._flusher_idle = False
+        self._closed = False
+        self._flush_thread = Thread(target=self._flush_loop, daemon=True)
+        self._flush_thread.start()
+
+        # Message headers pointing at the buffer pool, built once
+        if _sendmmsg is not None:
+            self._c_bufs = [
+                (ctypes.c_char * buffer_size).from_buffer(buf)
+                for buf in self._bufs]
+            self._iovecs = (_IOVec * batch_size)()
+            self._mmsgs = (_MMsgHdr * batch_size)()
+            for i, c_buf in enumerate(self._c_bufs):
+                self._iovecs[i].iov_base = ctypes.addressof(c_buf)
+                self._mmsgs[i].msg_hdr.msg_iov = ctypes.pointer(
+                    self._iovecs[i])
+                self._mmsgs[i].msg_hdr.msg_iovlen = 1
+
+    def send(self, data):
+        """
+        Queue a datagram for sending.
+
+        Parameters
+        ----------
+        data : bytes-like object
+            Datagram payload, at most buffer_size bytes long.
+
+        Raises
+        ------
+        ValueError
+            if the datagram is longer than buffer_size.
+        OSError
+            if the batcher has been closed.
+
+        Returns
+        -------
+        None.
+
+        """
+        n = len(data)
+        if n > self.buffer_size:
+            raise ValueError(
+                "Datagram of {:d} bytes exceeds the buffer size of {:d} "
+                "bytes!".format(n, self.buffer_size))
+
+        with self._lock:
+            if self._closed:
+                raise OSError(errno.EBADF, "SendmmsgBatcher is closed")
+
+            i = self._n
+            self._mvs[i][:n] = data
+            self._lens[i] = n
+            self._n = i + 1
+
+            if self._n == self.batch_size:
+                self._flush()
+            elif self._deadline is None:
+                self._deadline = time.monotonic() + self.max_delay
+                if self._flusher_idle:
+                    self._cond.notify()
+
+    def flush(self):
+        """
+        Send all queued datagrams.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """
+        Send all queued datagrams and stop using the socket.
+
+        Any subsequent attempt to send raises an OSError.
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock:
+            self._flush()
+            self._fd = -1
+            self._closed = True
+            self._cond.notify()
+
+        if self._flush_thread is not current_thread():
+            self._flush_thread.join()
+
+    def _flush_loop(self):
+        """
+        Send batches not filled within max_delay (flushing thread).
+
+        Returns
+        -------
+        None.
+
+        """
+        with self._lock:
+            while not self._closed:
+                if self._deadline is None:
+                    self._flusher_idle = True
+                    self._cond.wait()
+                    self._flusher_idle = False
+                    continue
+
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                else:
+                    try:
+                        self._flush()
+                    except OSError as err:
+                        # Keep serving later batches
+                        print(err)
+
+    def _flush(self):
+        # Must be called with self._lock held
+        self._deadline = None
+
+        n = self._n
+        if n == 0:
+            return
+        self._n = 0
+
+        try:
+            if self.gso:
+                seg_size = self._gso_segment_size(n)
+                if seg_size:
+                    try:
+                        self.sock.sendmsg(
+                            [self._mvs[i][:self._lens[i]] for i in range(n)],
+                            [(socket.IPPROTO_UDP,
+                              _UDP_SEGMENT,
+                              _UDP_SEGMENT_STRUCT.pack(seg_size))])
+                        return
+                    except ConnectionRefusedError:
+                        raise
+                    except OSError:
+                        # GSO not supported by the kernel or the device
+                        self.gso = False
+
+            if _sendmmsg is not None:
+                for i in range(n):
+                    self._iovecs[i].iov_len = self._lens[i]
+                _sendmmsg_all(self._fd, self._mmsgs, n)
+            else:
+                for i in range(n):
+                    self.sock.send(self._mvs[i][:self._lens[i]])
+        except ConnectionRefusedError:
+            pass
+
+    def _gso_segment_size(self, n):
+        """
+        Check whether the first n queued datagrams can be sent with GSO.
+
+        Parameters
+        ----------
+        n : int
+            Number of queued datagrams.
+
+        Returns
+        -------
+        int
+            Segment size to use, or 0 if GSO can not be used.
+
+        """
+        if not 1 < n <= _UDP_GSO_MAX_SEGMENTS:
+            return 0
+
+        lens = self._lens
+        seg_size = lens[0]
+
+        if (lens[n - 1] > seg_size
+                or sum(lens[:n]) > _UDP_GSO_MAX_BYTES
+                or any(lens[i] != seg_size for i in range(1, n - 1))):
+            return 0
+
+        return seg_size
+
+class _SendmmsgHeaders():
+    """
+    A class to send lists of datagrams through a connected UDP socket with
+    sendmmsg(), reusing a pool of pre-allocated message headers (Linux only).
+
+    The datagrams are not copied: the headers point straight at the data of
+    the bytes objects passed to send(). A lock serialises access to the
+    pool, so send() may be called from several threads concurrently.
+
+    Parameters
+    ----------
+    n : int
+        Number of message headers, i.e. maximum number of datagrams per
+        sendmmsg() call.
+
+    """
+    def __init__(self, n):
+        self.n = n
+        self._iovecs = (_IOVec * n)()
+        self._mmsgs = (_MMsgHdr * n)()
+        self._lock = Lock()
+
+        # msg_name is left NULL, i.e. the address the socket is connected to
+        for i in range(n):
+            self._mmsgs[i].msg_hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            self._mmsgs[i].msg_hdr.msg_iovlen = 1
+
+    def send(self, fd, buffers):
+        """
+        Send a list of datagrams, n at a time.
+
+        Parameters
+        ----------
+        fd : int
+            Connected socket file descriptor.
+        buffers : list of bytes
+            Datagrams to send.
+
+        Raises
+        ------
+        OSError
+            if sendmmsg() fails.
+
+        Returns
+        -------
+        None.
+
+        """
+        iovecs = self._iovecs
+
+        with self._lock:
+            for start in range(0, len(buffers), self.n):
+                chunk = buffers[start:start + self.n]
+                for i, buf in enumerate(chunk):
+                    # The buffers list keeps the (immutable) bytes objects
+                    # alive for the whole call
+                    iovec = iovecs[i]
+                    iovec.iov_base = ctypes.cast(
+                        ctypes.c_char_p(buf), ctypes.c_void_p).value
+                    iovec.iov_len = len(buf)
+
+                _sendmmsg_all(fd, self._mmsgs, len(chunk))
+
+class _RecvmmsgBuffers():
+    """
+    Pre-allocated buffers for receiving several datagrams from a UDP socket
+    with a single recvmmsg() system call (Linux).
+
+    Parameters
+    ----------
+    n : int
+        Maximum number of datagrams received per call.
+    buffer_size : int
+        Size of each datagram buffer (bytes). Longer datagrams are truncated.
+
+    """
+    def __init__(self, n, buffer_size):
+        self.n = n
+
+        self._bufs = [ctypes.create_string_buffer(buffer_size) for _ in range(n)]
+        self._buf_addrs = [ctypes.addressof(buf) for buf in self._bufs]
+        self._buf_views = [memoryview(buf).cast("B") for buf in self._bufs]
+        self._names = ((ctypes.c_char * 16) * n)()
+        self._iovecs = (_IOVec * n)()
+        self._mmsgs = (_MMsgHdr * n)()
+
+        for i in range(n):
+            self._iovecs[i].iov_base = self._buf_addrs[i]
+            self._iovecs[i].iov_len = buffer_size
+            hdr = self._mmsgs[i].msg_hdr
+            hdr.msg_name = ctypes.addressof(self._names[i])
+            hdr.msg_namelen = 16
+            hdr.msg_iov = ctypes.pointer(self._iovecs[i])
+            hdr.msg_iovlen = 1
+
+        # Views of the received lengths (msg_len of each message header) and
+        # of the source addresses (sockaddr_in structures), read without
+        # ctypes attribute accesses per datagram
+        self._msg_lens = memoryview(self._mmsgs).cast("B").cast("I")[
+            _MMsgHdr.msg_len.offset // 4::ctypes.sizeof(_MMsgHdr) // 4]
+        self._names_view = memoryview(self._names).cast("B")
+
+        # Source addresses seen so far, by sockaddr_in port and address bytes
+        self._addr_cache = {}
+
+    def recv(self, fd, copy=True):
+        """
+        Receive the datagrams waiting on a socket, without blocking.
+
+        Parameters
+        ----------
+        fd : int
+            Socket file descriptor.
+        copy : bool, optional
+            If True, the data of each datagram is copied into a bytes object.
+            If False, memoryviews of the internal buffers are returned, which
+            are only valid until the next call. The default is True.
+
+        Raises
+        ------
+        OSError
+            if recvmmsg() fails.
+
+        Returns
+        -------
+        list of tuples, (data, address)
+            Received data (bytes or memoryview) and source address
+            (ip_address, port) of up to n datagrams (none if no datagram is
+            waiting).
+
+        """
+        mmsgs = self._mmsgs
+        n = _recvmmsg(fd, mmsgs, self.n, socket.MSG_DONTWAIT, None)
+        if n < 0:
+            err = ctypes.get_errno()
+            if err in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(err, os.strerror(err))
+
+        msg_lens = self._msg_lens
+        names = self._names_view[:16 * n].tobytes()
+
+        addr_cache = self._addr_cache
+        buf_views = self._buf_views
+        datagrams = []
+        for i in range(n):
+            raw_addr = names[16 * i + 2:16 * i + 8]
+            address = addr_cache.get(raw_addr)
+            if address is None:
+                address = addr_cache[raw_addr] = (
+                    socket.inet_ntoa(raw_addr[2:]),
+                    _SOCKADDR_IN_PORT_STRUCT.unpack_from(raw_addr)[0])
+            data = buf_views[i][:msg_lens[i]]
+            datagrams.append((data.tobytes() if copy else data, address))
+
+        return datagrams
+
+class _DatagramReader():
+    """
+    Receives the datagrams waiting on non-blocking UDP sockets: several at a
+    time with recvmmsg() where available (Linux), otherwise one at a time.
+    The maximum number of datagrams returned per call is batch_size.
+
+    Parameters
+    ----------
+    buffer_size : int
+        Maximum datagram size (bytes). Longer datagrams are truncated.
+
+    """
+    def __init__(self, buffer_size):
+        self.buffer_size = buffer_size
+
+        # Buffers for draining several datagrams per wake-up (Linux only),
+        # or for receiving one datagram without copying it
+        if _recvmmsg is not None:
+            self.batch_size = _RX_BATCH
+            self._rx_bufs = _RecvmmsgBuffers(_RX_BATCH, buffer_size)
+        else:
+            self.batch_size = 1
+            self._rx_bufs = None
+            self._rx_buf = bytearray(buffer_size)
+            self._rx_view = memoryview(self._rx_buf)
+
+    def recv(self, sock, copy=True):
+        """
+        Receive the datagrams waiting on a socket, without blocking.
+
+        Parameters
+        ----------
+        sock : socket.socket
+            Non-blocking UDP socket.
+        copy : bool, optional
+            If True, the data of each datagram is returned as a bytes object.
+            If False, memoryviews of the internal buffers are returned, which
+            are only valid until the next call. The default is True.
+
+        Raises
+        ------
+        OSError
+            if receiving fails.
+
+        Returns
+        -------
+        list of tuples, (data, address)
+            Received data (bytes or memoryview) and source address
+            (ip_address, port) of the datagrams (none if no datagram is
+            waiting).
+
+        """
+        if self._rx_bufs is not None:
+            return self._rx_bufs.recv(sock.fileno(), copy)
+
+        try:
+            if copy:
+                return [sock.recvfrom(self.buffer_size)]
+
+            n_bytes, address = sock.recvfrom_into(self._rx_buf)
+            return [(self._rx_view[:n_bytes], address)]
+        except BlockingIOError:
+            return []
+
+class _SharedRxSocket():
+    """
+    A UDP socket listening on a port on behalf of several UDPInterface
+    objects (listeners), with its own receiving thread.
+
+    Each datagram is received once and passed to all listeners, rather than
+    the kernel queuing a copy for each of several sockets bound to the port.
+    Listeners are tuples (recv_cbk, copy, log_recv), where recv_cbk is the
+    receive callback (or None), copy is True if the callback is passed bytes
+    rather than a memoryview of the receiving buffer, and log_recv prints
+    debugging output (see make_data_logger()). If any listener needs a
+    copy, all of them are passed the same (immutable) bytes object.
+
+    The socket and thread use the settings (buffer_size, rcvbuf_bytes,
+    rx_cpu_affinity and verbosity) of the interface that creates them.
+    Listeners are added and removed with the module-level lock held (see
+    _attach_shared_rx_socket()).
+
+    If receiving fails, the socket is closed, the receiving thread stops and
+    the error is kept in the error attribute, for the listening interfaces
+    to report (see UDPInterface.wait_ready()). Exceptions raised by receive
+    callbacks are printed, and do not stop the thread.
+
+    Parameters
+    ----------
+    port : int
+        UDP port to listen on.
+    interface : UDPInterface
+        Interface creating the socket.
+
+    """
+    def __init__(self, port, interface):
+        self.port = port
+        self.buffer_size = interface.buffer_size
+        self.rx_cpu_affinity = interface.rx_cpu_affinity
+        self.verbosity = interface.verbosity
+
+        self.sock = interface._open_recv_socket(port)
+        self.error = None
+
+        # Listeners, and the functions to call per datagram with whether any
+        # of them needs a copy, replaced as a whole so that the receiving
+        # thread never sees a partial update
+        self._listeners = ()
+        self._state = ((), False)
+
+        self._run = True
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._thread = Thread(target=self._rx_loop, daemon=True)
+        self._thread.start()
+
+    def add_listener(self, listener):
+        """
+        Start passing received data to a listener.
+
+        Parameters
+        ----------
+        listener : tuple, (recv_cbk, copy, log_recv)
+            Listener.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._set_listeners(self._listeners + (listener,))
+
+    def remove_listener(self, listener):
+        """
+        Stop passing received data to a listener.
+
+        Parameters
+        ----------
+        listener : tuple
+            Listener passed to add_listener().
+
+        Returns
+        -------
+        int
+            Number of remaining listeners.
+
+        """
+        listeners = tuple(
+            other for other in self._listeners if other is not listener)
+        self._set_listeners(listeners)
+
+        return len(listeners)
+
+    def _set_listeners(self, listeners):
+        # The receiving thread only needs the function to call per datagram
+        # for each listener (see make_recv_handler())
+        handlers = [
+            make_recv_handler(recv_cbk, log_recv)
+            for recv_cbk, _, log_recv in listeners]
+
+        self._listeners = listeners
+        self._state = (
+            tuple(handler for handler in handlers if handler is not None),
+            any(recv_cbk is not None and copy
+                for recv_cbk, copy, _ in listeners))
+
+    def _rx_loop(self):
+        # Receive data and pass it to the listeners (receiving thread)
+        if self.rx_cpu_affinity is not None:
+            os.sched_setaffinity(0, self.rx_cpu_affinity)
+
+        sel = selectors.DefaultSelector()
+        sel.register(self.sock, selectors.EVENT_READ, self.port)
+        sel.register(self._wake_r, selectors.EVENT_READ, None)
+
+        reader = _DatagramReader(self.buffer_size)
+
+        while self._run:
+            for key, _ in sel.select():
+                if key.data is None:
+                    continue
+
+                handlers, copy = self._state
+
+                # Keep receiving while full batches are returned (see
+                # _RX_MAX_BATCHES)
+                for _ in range(_RX_MAX_BATCHES):
+                    try:
+                        datagrams = reader.recv(self.sock, copy)
+                    except OSError as err:
+                        if self.verbosity > 0:
+                            print(err, flush=True)
+                        # Release the port before reporting the error, so
+                        # that a new shared socket can be opened for it
+                        sel.unregister(self.sock)
+                        self.sock.close()
+                        self.error = err
+                        self._run = False
+                        break
+
+                    for data, address in datagrams:
+                        for handler in handlers:
+                            try:
+                                handler(address, data)
+                            except Exception as err:
+                                # Keep serving the other listeners
+                                print(err, flush=True)
+
+                    if len(datagrams) < reader.batch_size:
+                        break
+
+        sel.close()
+
+    def close(self):
+        """
+        Stop the receiving thread and close the socket.
+
+        Returns
+        -------
+        None.
+
+        """
+        self._run = False
+        self._wake_w.send(b"\x00")
+        self._thread.join(6)
+
+        self.sock.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+        if self.verbosity > 0:
+            print("UDP socket for port {:d} closed. ".format(self.port),
+                  flush=True)
+
 class UDPInterface():
     """
     A class to manage UDP communications with a VDES1000 unit.
@@ -64,8 +1119,11 @@ class UDPInterface():
 
         address : tuple, (ip_address, port)
             Source address.
-        data : str
-            Received data.
+        data : bytes
+            Received data (a memoryview if recv_zero_copy is True).
+
+        If n_listen_sockets_per_port > 1, the callback may be called from
+        several threads concurrently and must be thread-safe.
 
         The default is None.
     recv_cbk_aist : function, optional
@@ -78,6 +1136,98 @@ class UDPInterface():
         The default is None.
     buffer_size : int, optional
         Size of the UDP receiving buffer (bytes). The default is 4096.
+    sndbuf_bytes : int, optional
+        Kernel send buffer size (SO_SNDBUF) for the sending socket (bytes).
+        If None, the operating system default is used.
+        The default is DEFAULT_SOCKET_BUFFER_BYTES (4 MiB).
+    rcvbuf_bytes : int, optional
+        Kernel receive buffer size (SO_RCVBUF) for the receiving sockets
+        (bytes). If None, the operating system default is used. Note that on
+        Linux the effective value is capped by net.core.rmem_max (and
+        net.core.wmem_max for SO_SNDBUF); the effective values are checked
+        and reported if verbosity > 0.
+        The default is DEFAULT_SOCKET_BUFFER_BYTES (4 MiB).
+    n_listen_sockets_per_port : int, optional
+        Number of receiving sockets per listening port, and of receiving
+        threads. Each receiving thread serves one socket per listening port
+        through a selector (epoll/kqueue). If > 1, the sockets are bound to
+        the same port using SO_REUSEPORT and the kernel distributes incoming
+        datagrams among them (per source address/port pair on Linux). Not
+        available on all platforms. The default is 1.
+    reuse_port : bool, optional
+        If True, the receiving sockets are bound with SO_REUSEPORT where
+        available, so that other sockets (e.g. of other processes run by the
+        same user) can listen on the same ports, the kernel distributing
+        incoming datagrams among all of them. Note that the distribution is
+        per source address/port pair on Linux: datagrams from a single
+        VDES1000 port all go to the same socket, whereas traffic from
+        several units (or ports) is spread across processes. Sockets
+        without the option cannot share the ports. As a second instance (or
+        a stale process) listening on the same ports would then silently
+        take part of the traffic rather than fail to bind, this is opt-in.
+        SO_REUSEPORT is always used if n_listen_sockets_per_port > 1.
+        The default is False.
+    ip_multicast_all : bool, optional
+        IP_MULTICAST_ALL value for the receiving sockets (Linux only). If
+        False, they only receive multicast traffic for groups they joined
+        (none), rather than for every group joined on the host, sparing the
+        kernel-to-user copies of unrelated traffic. The default is False.
+    ip_multicast_loop : bool, optional
+        IP_MULTICAST_LOOP value for the sending socket. If False, multicast
+        datagrams sent to the VDES1000 are not looped back to local sockets
+        (including the receiving ones). This is a sender-side option on
+        Linux, so it is not set on the receiving sockets. Has no effect for
+        unicast destinations. The default is False.
+    recv_zero_copy : bool, optional
+        If True, the receive callbacks are passed a memoryview of the
+        receiving buffer rather than a bytes copy of each datagram. The
+        memoryview is only valid during the callback, which must copy any
+        data it wants to retain (e.g. bytes(data)). Data for ports without a
+        callback is never copied. The default is False.
+    recv_queue_size : int, optional
+        If not None, received data is queued (up to recv_queue_size
+        datagrams) and the receive callbacks are called by a dedicated
+        thread, so that slow callbacks do not hold up the receiving threads
+        (and cause the kernel to drop datagrams). If the queue is full, the
+        oldest queued datagram is dropped; see n_rx_dropped. Callbacks are
+        then passed bytes, so this cannot be combined with recv_zero_copy.
+        If None, the callbacks are called by the receiving threads.
+        The default is None.
+    rx_cpu_affinity : int or iterable of int, optional
+        CPU core(s) to pin the receiving threads to (Linux only). Pinning the
+        threads to the cores that service the network interface's receive
+        interrupts keeps packet data in the same caches from the NIC's
+        receive ring to the callback, rather than moving it between cores or
+        chiplets. The interrupts of the receive queue(s) carrying the VDES1000
+        traffic should be steered to the same core(s), e.g. (as root, for
+        core 2 and NIC eth0):
+
+        - ethtool -N eth0 rx-flow-hash udp4 sd, to select the receive queue
+          of UDP traffic by source and destination address only, so that all
+          traffic from the VDES1000 lands on the same queue;
+        - grep eth0 /proc/interrupts, to find the queue's IRQ number <n>;
+        - echo 4 > /proc/irq/<n>/smp_affinity (hexadecimal CPU mask, bit 2),
+          or the set_irq_affinity script distributed with NIC drivers. The
+          irqbalance service may need to be stopped, as it overrides this.
+
+        If None, the threads are not pinned. The default is None.
+    tx_thread : bool, optional
+        If True, messages are sent by a dedicated thread: the send methods
+        only queue them and return immediately, so that the caller is not
+        blocked when the kernel send buffer is full, and messages queued
+        while the thread is busy are sent together. Send errors are then
+        reported by the thread (if verbosity > 0) rather than raised. See
+        also await_drain(). The default is False.
+    share_listen_sockets : bool, optional
+        If True, each listening port is served by a socket (and receiving
+        thread) shared by all UDPInterface objects of the programme created
+        with this option, e.g. one per VDES1000 unit. Each datagram is then
+        received once and passed to the callbacks of all of them, instead of
+        the ports being unavailable to all but one interface. The socket and
+        thread are created with the settings (buffer_size, rcvbuf_bytes,
+        rx_cpu_affinity, verbosity) of the first interface listening on the
+        port, and closed when the last one is closed. Requires
+        n_listen_sockets_per_port = 1. The default is False.
     verbosity : int, optional
         Verbosity for the UDP interface (0-3) - set > 0 for debugging.
         The default is 0.
@@ -96,6 +1246,17 @@ class UDPInterface():
             recv_cbk_aist=None,
             recv_cbk_ccrd=None,
             buffer_size=4096,
+            sndbuf_bytes=DEFAULT_SOCKET_BUFFER_BYTES,
+            rcvbuf_bytes=DEFAULT_SOCKET_BUFFER_BYTES,
+            n_listen_sockets_per_port=1,
+            reuse_port=False,
+            ip_multicast_all=False,
+            ip_multicast_loop=False,
+            recv_zero_copy=False,
+            recv_queue_size=None,
+            rx_cpu_affinity=None,
+            tx_thread=False,
+            share_listen_sockets=False,
             verbosity=0):
 
         # Initialise attributes
@@ -107,31 +1268,143 @@ class UDPInterface():
         self.listen_aist = listen_aist
         self.listen_ccrd = listen_ccrd
         self.buffer_size = buffer_size
+        self.sndbuf_bytes = sndbuf_bytes
+        self.rcvbuf_bytes = rcvbuf_bytes
+        self.n_listen_sockets_per_port = n_listen_sockets_per_port
+        self.reuse_port = reuse_port
+        self.ip_multicast_all = ip_multicast_all
+        self.ip_multicast_loop = ip_multicast_loop
+        self.recv_zero_copy = recv_zero_copy
+        self.recv_queue_size = recv_queue_size
+        self.share_listen_sockets = share_listen_sockets
+        if isinstance(rx_cpu_affinity, int):
+            rx_cpu_affinity = (rx_cpu_affinity,)
+        self.rx_cpu_affinity = (
+            None if rx_cpu_affinity is None else set(rx_cpu_affinity))
         self.verbosity=verbosity
 
+        # Debugging output for sent/received data, no-op if verbosity < 2
+        self._log_send = make_data_logger(verbosity, "sent to", repr)
+        self._log_recv = make_data_logger(
+            verbosity, "received from", decode_data)
+
+        if n_listen_sockets_per_port > 1 and SO_REUSEPORT is None:
+            raise ValueError(
+                "Multiple sockets per port require SO_REUSEPORT, which is "
+                "not supported on this platform!")
+
+        if rx_cpu_affinity is not None and not hasattr(os, "sched_setaffinity"):
+            raise ValueError(
+                "CPU affinity is not supported on this platform!")
+
+        if share_listen_sockets and n_listen_sockets_per_port > 1:
+            raise ValueError(
+                "Shared listening sockets require one socket per port!")
+
+        if recv_queue_size is not None and recv_zero_copy:
+            raise ValueError(
+                "Queued receive callbacks cannot be passed memoryviews!")
+
         # Create a UDP socket for sending data to the VDES1000
         self.udp_send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
-        # Start threads for receiving data via UDP (one thread per port)
-        # TODO: Add a thread for dest_port_ccrd
+        if sndbuf_bytes is not None:
+            self._set_socket_buffer(
+                self.udp_send_sock, socket.SO_SNDBUF, sndbuf_bytes)
+
+        # Do not loop multicast datagrams sent back to local sockets, unless
+        # requested
+        setsockopt_best_effort(
+            self.udp_send_sock, socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP,
+            int(ip_multicast_loop))
+
+        # Misc sentences are the only ones sent, so the socket is connected
+        # to their destination: send() then skips the per-datagram address
+        # copy and route lookup of sendto(), but the socket can no longer
+        # send to any other destination
+        self._misc_address = (ip_address, dest_port_misc)
+        self.udp_send_sock.connect(self._misc_address)
+
+        # Message headers for sending several messages at once (Linux only)
+        self._tx_headers = (
+            None if _sendmmsg is None
+            else _SendmmsgHeaders(_TX_SENDMMSG_POOL))
+
+        # Start a thread for sending data, if requested
+        self._tx_queue = None
+        self._tx_thread = None
+        if tx_thread:
+            self._tx_queue = SimpleQueue()
+            self._tx_thread = Thread(target=self._tx_loop, daemon=True)
+            self._tx_thread.start()
+
+        # Ports to listen on and their receive callbacks
+        # TODO: Add dest_port_ccrd
+        rx_ports = []
+        if listen_misc is True:
+            rx_ports.append((self.dest_port_misc, recv_cbk_misc))
+        if listen_aist is True:
+            rx_ports.append((self.dest_port_aist, recv_cbk_aist))
+
+        # Start a thread for calling the receive callbacks, if requested, and
+        # queue received data for it instead
+        self._rx_queue = None
+        self._rx_queue_event = None
+        self._rx_worker = None
+        self._rx_worker_stop = False
+        self._n_rx_dropped = 0
+        if recv_queue_size is not None:
+            self._rx_queue = deque(maxlen=recv_queue_size)
+            self._rx_queue_event = Event()
+            self._rx_worker = Thread(target=self._rx_worker_loop, daemon=True)
+            self._rx_worker.start()
+
+            rx_ports = [
+                (port, None if recv_cbk is None
+                 else self._make_queuing_cbk(recv_cbk))
+                for port, recv_cbk in rx_ports]
+
         if any([listen_misc, listen_aist, listen_ccrd]):
             self.run_recv = True
         else:
             self.run_recv = False
 
+        # Socket pair used by close() to wake up the receiving threads
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._closed = False
+
         self.threads = []
 
-        if listen_misc is True:
-            t = Thread(
-                target=self.recv,
-                args=(self.dest_port_misc,recv_cbk_misc))
-            t.start()
-            self.threads.append(t)
+        # Listen on shared sockets, bound before they are returned, rather
+        # than starting receiving threads. If a port cannot be bound, release
+        # everything set up so far.
+        self._shared_rx = []
+        if share_listen_sockets:
+            try:
+                for port, recv_cbk in rx_ports:
+                    listener = (
+                        recv_cbk, not recv_zero_copy, self._log_recv)
+                    self._shared_rx.append(
+                        (_attach_shared_rx_socket(port, self, listener),
+                         listener))
+            except Exception:
+                self.close()
+                raise
+            rx_ports = []
 
-        if listen_aist is True:
-            t = Thread(
-                target=self.recv,
-                args=(self.dest_port_aist,recv_cbk_aist))
+        # Set once all receiving sockets are bound and listening, or once a
+        # receiving thread has failed to set up its sockets (see _rx_error)
+        self._ready = Event()
+        self._ready_lock = Lock()
+        self._rx_error = None
+        self._n_rx_pending = n_listen_sockets_per_port if rx_ports else 0
+        if self._n_rx_pending == 0:
+            self._ready.set()
+
+        # Start threads for receiving data via UDP (one thread per
+        # n_listen_sockets_per_port, each serving one socket per port)
+        for _ in range(self._n_rx_pending):
+            t = Thread(target=self._rx_loop, args=(rx_ports,))
             t.start()
             self.threads.append(t)
 
@@ -157,6 +1430,83 @@ class UDPInterface():
         """
         return len(self.threads)
 
+    @property
+    def n_rx_dropped(self):
+        """
+        Returns
+        -------
+        int
+            Number of received datagrams dropped because the receive queue
+            was full (see recv_queue_size). Approximate if several threads
+            receive data.
+
+        """
+        return self._n_rx_dropped
+
+    def wait_ready(self, timeout=None):
+        """
+        Wait until all receiving sockets are bound and listening.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum time to wait (seconds). If None, wait indefinitely.
+            The default is None.
+
+        Raises
+        ------
+        OSError
+            if a receiving socket could not be opened (e.g. its port is in
+            use), or a shared receiving socket has failed. The receiving
+            thread concerned has then stopped; call close() to stop the
+            others.
+
+        Returns
+        -------
+        bool
+            True if all receiving sockets are listening, False if the wait
+            timed out.
+
+        """
+        if not self._ready.wait(timeout):
+            return False
+
+        if self._rx_error is not None:
+            raise self._rx_error
+
+        for shared_sock, _ in self._shared_rx:
+            if shared_sock.error is not None:
+                raise shared_sock.error
+
+        return True
+
+    def await_drain(self, timeout=None):
+        """
+        Wait until all messages queued for the sending thread have been sent.
+
+        Returns immediately if the interface has no sending thread.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Maximum time to wait (seconds). If None, wait indefinitely.
+            The default is None.
+
+        Returns
+        -------
+        bool
+            True if all messages queued before the call have been sent, False
+            if the wait timed out.
+
+        """
+        if self._tx_queue is None:
+            return True
+
+        drained = Event()
+        self._tx_queue.put(drained)
+
+        return drained.wait(timeout)
+
     def send_misc_iec_msg(self, msg_str):
         """
         Send an IEC 61162-450 message carrying a 'miscelaneous' sentence.
@@ -164,116 +1514,391 @@ class UDPInterface():
         Message is sent to the ip_address and dest_port_misc specified during
         the initialisation of the interface object.
 
-        Prints debugging output if self.verbosity > 0.
+        Prints debugging output if self.verbosity > 1.
+
+        Parameters
+        ----------
+        msg_str : str or bytes-like
+            IEC 61162-450 message string (or its ASCII bytes).
+
+        Returns
+        -------
+        None.
+
+        """
+        # Send the IEC message to its desitnation via UDP (bytes are sent as
+        # they are)
+        msg = encode_msg(msg_str)
+
+        if self._tx_queue is not None:
+            self._tx_queue.put([bytes(msg)])
+        else:
+            try:
+                self.udp_send_sock.send(msg)
+            except ConnectionRefusedError:
+                # Nothing listening at the destination (reported for an
+                # earlier datagram), dropped as with an unconnected socket
+                pass
+        self._log_send(self._misc_address, msg_str)
+
+    def send_misc_iec_msgs(self, msg_strs):
+        """
+        Send several IEC 61162-450 messages carrying 'miscelaneous' sentences.
+
+        The messages are sent, in order, to the ip_address and dest_port_misc
+        specified during the initialisation of the interface object. Where
+        available (Linux), all messages are passed to the kernel in a single
+        sendmmsg() system call, otherwise they are sent one by one.
+
+        Prints debugging output if self.verbosity > 1.
+
+        Parameters
+        ----------
+        msg_strs : list of str or bytes
+            IEC 61162-450 message strings (or their ASCII bytes).
+
+        Returns
+        -------
+        None.
+
+        """
+        msgs = [encode_msg(msg_str) if isinstance(msg_str, str)
+                else bytes(msg_str)
+                for msg_str in msg_strs]
+
+        if self._tx_queue is not None:
+            self._tx_queue.put(msgs)
+        else:
+            self._send_misc(msgs)
+
+        if self._log_send is not NULL_LOG:
+            for msg_str in msg_strs:
+                self._log_send(self._misc_address, msg_str)
+
+    def _send_misc(self, msgs):
+        """
+        Send datagrams to the ip_address and dest_port_misc, using a single
+        sendmmsg() system call where available.
+
+        Datagrams refused by the destination (nothing listening) are dropped,
+        as they would be with an unconnected socket.
 
         Parameters
         ----------
-        msg_str : str
-            IEC 61162-450 message string.
+        msgs : list of bytes
+            Datagrams to send.
 
         Returns
         -------
         None.
 
         """
-        # Send the IEC message to its desitnation via UDP, use UTF-8 encoding
-        self.udp_send_sock.sendto(
-            msg_str.encode(),
-            (self.ip_address, self.dest_port_misc))
-        # if self.verbosity > 1:
-        #     print(
-        #         "\nData sent to {:s}:{:d}:".format(
-        #             self.ip_address, self.dest_port_misc))
-        # if self.verbosity > 2:
-        #     print(repr(msg_str), flush=True)
-        if self.verbosity > 1:
-            print_str = (
-                "\nData sent to {:s}:{:d}".format(
-                    self.ip_address, self.dest_port_misc))
-        if self.verbosity > 2:
-            print_str += (":\n" + repr(msg_str))
+        try:
+            if len(msgs) > 1 and self._tx_headers is not None:
+                self._tx_headers.send(self.udp_send_sock.fileno(), msgs)
+            else:
+                send = self.udp_send_sock.send
+                for msg in msgs:
+                    send(msg)
+        except ConnectionRefusedError:
+            pass
+
+    def _tx_loop(self):
+        """
+        Send the messages queued by the send methods (sending thread).
 
-        print(print_str, flush=True)
+        Messages already queued when the thread wakes up are coalesced into
+        one batch. Queued threading.Event objects are set once all messages
+        queued before them have been sent (see await_drain()); a queued None
+        stops the thread.
 
+        Returns
+        -------
+        None.
 
-    def recv(self, port, recv_cbk):
         """
-        Receive data on a specified UDP port.
+        tx_queue = self._tx_queue
+
+        while True:
+            items = [tx_queue.get()]
+            while len(items) < _TX_MAX_BATCH and not tx_queue.empty():
+                items.append(tx_queue.get())
+
+            msgs = []
+            for item in items:
+                if isinstance(item, list):
+                    msgs += item
+                    continue
+
+                # Send whatever was queued before the marker first
+                if msgs:
+                    self._tx_send(msgs)
+                    msgs = []
+
+                if item is None:
+                    return
+
+                item.set()
+
+            if msgs:
+                self._tx_send(msgs)
+
+    def _tx_send(self, msgs):
+        # Send a batch from the sending thread, which has no caller to raise
+        # errors to
+        try:
+            self._send_misc(msgs)
+        except OSError as err:
+            if self.verbosity > 0:
+                print(err, flush=True)
 
-        Prints debugging output if self.verbosity > 0.
+    def _set_socket_buffer(self, sock, option, n_bytes):
+        # See set_socket_buffer() (module-level)
+        return set_socket_buffer(sock, option, n_bytes, self.verbosity)
+
+    def _open_recv_socket(self, port):
+        """
+        Create a non-blocking UDP socket listening on a specified port.
 
         Parameters
         ----------
         port : int
             UDP port to listen on.
-        recv_cbk : function
-            Receive event callback function.
 
-            Expected arguments:
+        Returns
+        -------
+        socket.socket
+            Receiving socket.
+
+        """
+        udp_recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        try:
+            if self.rcvbuf_bytes is not None:
+                self._set_socket_buffer(
+                    udp_recv_sock, socket.SO_RCVBUF, self.rcvbuf_bytes)
+
+            # Only receive multicast traffic for groups joined by this socket
+            # (none), rather than for all groups joined on the host (Linux
+            # only), unless requested
+            setsockopt_best_effort(
+                udp_recv_sock, socket.IPPROTO_IP, IP_MULTICAST_ALL,
+                int(self.ip_multicast_all))
+
+            # Let several sockets listen on the port, the kernel distributing
+            # the datagrams among them (required for several sockets per
+            # port, best effort otherwise)
+            if self.n_listen_sockets_per_port > 1:
+                udp_recv_sock.setsockopt(socket.SOL_SOCKET, SO_REUSEPORT, 1)
+            elif self.reuse_port:
+                setsockopt_best_effort(
+                    udp_recv_sock, socket.SOL_SOCKET, SO_REUSEPORT, 1)
+
+            udp_recv_sock.setblocking(False)
+
+            udp_recv_sock.bind(("", port))
+            # Apparently this is not possible, so have to use different ports
+            # on different VDES units.
+            # udp_recv_sock.bind((self.ip_address, port))
+            # TODO: Test this again with actual VDES1000 hardware:
+        except OSError:
+            # Do not leave the socket to the garbage collector
+            udp_recv_sock.close()
+            raise
+
+        if self.verbosity > 0:
+            print("Listening to traffic on UDP port {:d} ... ".format(port),
+                  flush=True)
+
+        return udp_recv_sock
+
+    def _rx_loop(self, rx_ports):
+        """
+        Receive data on the specified UDP ports (receiving thread).
+
+        One socket is opened per port, and all of them are served by a single
+        selector (epoll/kqueue), until close() is called.
+
+        Prints debugging output if self.verbosity > 0. Exceptions raised by
+        the receive callbacks are printed, and do not stop the thread.
+
+        Parameters
+        ----------
+        rx_ports : list of tuples, (port, recv_cbk)
+            UDP ports to listen on and their receive event callback functions.
+
+            Expected callback arguments:
 
             address : tuple, (ip_address, port)
                 Source address.
-            data : str
-                Received data.
+            data : bytes or memoryview
+                Received data. See recv_zero_copy.
 
         Returns
         -------
         None.
 
         """
-        if self.verbosity > 0:
-            print("Listening to traffic on UDP port {:d} ... ".format(port),
-                  flush=True)
+        sel = selectors.DefaultSelector()
 
-        udp_recv_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            # Pin this thread to the requested CPU cores
+            if self.rx_cpu_affinity is not None:
+                os.sched_setaffinity(0, self.rx_cpu_affinity)
 
-        udp_recv_sock.settimeout(5)
+                if self.verbosity > 0:
+                    print("Receiving thread for UDP port(s) {} pinned to "
+                          "CPU(s) {}".format(
+                              [port for port, _ in rx_ports],
+                              sorted(os.sched_getaffinity(0))),
+                          flush=True)
 
-        udp_recv_sock.bind(("", port))
-        # Apparently this is not possible, so have to use different ports on
-        # different VDES units.
-        # udp_recv_sock.bind((self.ip_address, port))
-        # TODO: Test this again with actual VDES1000 hardware:
+            for port, recv_cbk in rx_ports:
+                # Datagrams are only copied if passed to a callback that may
+                # retain them
+                copy = recv_cbk is not None and not self.recv_zero_copy
+                sel.register(
+                    self._open_recv_socket(port),
+                    selectors.EVENT_READ,
+                    (port, make_recv_handler(recv_cbk, self._log_recv),
+                     copy))
+        except OSError as err:
+            # Report the error through wait_ready() rather than letting it
+            # end the thread unnoticed
+            if self.verbosity > 0:
+                print(err, flush=True)
+
+            for key in list(sel.get_map().values()):
+                key.fileobj.close()
+            sel.close()
+
+            with self._ready_lock:
+                if self._rx_error is None:
+                    self._rx_error = err
+                self._ready.set()
+            return
+
+        # Readable once close() has been called
+        sel.register(self._wake_r, selectors.EVENT_READ, None)
+
+        reader = _DatagramReader(self.buffer_size)
+
+        with self._ready_lock:
+            self._n_rx_pending -= 1
+            if self._n_rx_pending == 0:
+                self._ready.set()
+
+        # Block until data is received or close() is called, without periodic
+        # wake-ups
+        try:
+            while self.run_recv:
+                for key, _ in sel.select():
+                    if key.data is None:
+                        continue
+
+                    port, handler, copy = key.data
+
+                    # Keep receiving while full batches are returned, rather
+                    # than waiting on the selector in between (see
+                    # _RX_MAX_BATCHES)
+                    for _ in range(_RX_MAX_BATCHES):
+                        try:
+                            datagrams = reader.recv(key.fileobj, copy)
+                        except OSError as err:
+                            if self.verbosity > 0:
+                                print(err)
+                            # Stop listening on this port only
+                            sel.unregister(key.fileobj)
+                            key.fileobj.close()
+                            break
+
+                        # Call the receive callback function (and/or print
+                        # debugging output) and pass the source address (and
+                        # port) and received data. A failing callback must
+                        # not stop the reception on all ports.
+                        if handler is not None:
+                            for data, address in datagrams:
+                                try:
+                                    handler(address, data)
+                                except Exception as err:
+                                    print(err, flush=True)
+
+                        if len(datagrams) < reader.batch_size:
+                            break
+
+        finally:
+            # Tidy up
+            for key in list(sel.get_map().values()):
+                if key.data is not None:
+                    key.fileobj.close()
 
-        while self.run_recv:
-            try:
-                data, address = udp_recv_sock.recvfrom(self.buffer_size)
-            except socket.error as err:
-                if isinstance(err, socket.timeout):
-                    pass
-                else:
                     if self.verbosity > 0:
-                        print(err)
-                    break
-            else:
-                # if self.verbosity > 1:
-                #     print("\nData received from {:s}:{:d}: ".format(
-                #         address[0],
-                #         address[1]),
-                #         flush=True)
-                # if self.verbosity > 2:
-                #     print(data, flush=True)
-                if self.verbosity > 1:
-                    print_str = ("\nData received from {:s}:{:d}".format(
-                        address[0],
-                        address[1]))
-                if self.verbosity > 2:
-                    # TODO: Check that this is the correct way to decode data
-                    print_str += (":\n" + data.decode("utf-8"))
-
-                print(print_str, flush=True)
-
-                # Call the receive callback function and pass the source
-                # address (and port) and received data.
-                if recv_cbk is not None:
-                    recv_cbk(address, data)
+                        print("UDP socket for port {:d} closed. ".format(
+                            key.data[0]), flush=True)
 
-        # Tidy up
-        udp_recv_sock.close()
+            sel.close()
 
-        if self.verbosity > 0:
-            print("UDP socket for port {:d} closed. ".format(port),
-                  flush=True)
+    def _make_queuing_cbk(self, recv_cbk):
+        """
+        Create a receive callback queuing received data for recv_cbk, which
+        is then called by the thread running _rx_worker_loop().
+
+        Parameters
+        ----------
+        recv_cbk : function
+            Receive event callback function.
+
+        Returns
+        -------
+        queue_cbk : function
+            Receive event callback function, called by the receiving threads.
+
+        """
+        rx_queue = self._rx_queue
+        rx_queue_event = self._rx_queue_event
+        queue_size = rx_queue.maxlen
+
+        def queue_cbk(address, data):
+            # The deque drops the oldest item when full
+            if len(rx_queue) == queue_size:
+                self._n_rx_dropped += 1
+            rx_queue.append((recv_cbk, address, data))
+
+            # Setting the event takes a lock - skip it while the worker has
+            # not yet cleared it (it then finds the item when draining)
+            if not rx_queue_event.is_set():
+                rx_queue_event.set()
+
+        return queue_cbk
+
+    def _rx_worker_loop(self):
+        """
+        Call the receive callbacks for queued received data, until close()
+        has stopped all receiving threads and the queue has been drained
+        (receive callback thread).
+
+        Returns
+        -------
+        None.
+
+        """
+        rx_queue = self._rx_queue
+        rx_queue_event = self._rx_queue_event
+
+        while True:
+            rx_queue_event.wait()
+            rx_queue_event.clear()
+
+            # Data queued after clear() is found here, or sets the event
+            while rx_queue:
+                recv_cbk, address, data = rx_queue.popleft()
+                try:
+                    recv_cbk(address, data)
+                except Exception as err:
+                    print(err, flush=True)
+
+            if self._rx_worker_stop:
+                return
 
     def close(self):
         """
@@ -281,22 +1906,46 @@ class UDPInterface():
 
         Failing to call this method before the programme exits may result in
         the receiving threads continuing to run, preventing the respective UDP
-        ports from being reused.
+        ports from being reused. Calling it again has no effect.
 
         Returns
         -------
         None.
 
         """
+        if self._closed:
+            return
+        self._closed = True
+
+        # Stop the sending thread, once it has sent all queued messages
+        if self._tx_thread is not None:
+            self._tx_queue.put(None)
+            self._tx_thread.join(6)
+
         self.udp_send_sock.close()
 
         # Interrupts the receiving loops and consequently closes/stops the
         # corresponding sockets and threads.
         self.run_recv = False
+        self._wake_w.send(b"\x00")
 
         for t in self.threads:
             t.join(6)
 
+        for shared_sock, listener in self._shared_rx:
+            _detach_shared_rx_socket(shared_sock, listener)
+        self._shared_rx = []
+
+        # Nothing is queued any more - stop the receive callback thread, once
+        # it has called the callbacks for all queued data
+        if self._rx_worker is not None:
+            self._rx_worker_stop = True
+            self._rx_queue_event.set()
+            self._rx_worker.join(6)
+
+        self._wake_r.close()
+        self._wake_w.close()
+
 # =============================================================================
 # %% Quick & Dirty Testing
 # =============================================================================
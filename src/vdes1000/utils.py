@@ -24,21 +24,153 @@ limitations under the License.
 # =============================================================================
 # %% Import Statements
 # =============================================================================
-from threading import Lock
+import atexit
+import sys
+import traceback
+from queue import SimpleQueue
+from threading import Event, Lock, Thread
+from types import SimpleNamespace
 
 
 # =============================================================================
 # %% Function Definitions
 # =============================================================================
+def to_namespace(obj):
+    """
+    Recursively convert a dictionary (e.g. a loaded YAML configuration) into
+    a types.SimpleNamespace, allowing attribute-style access to its items.
+
+    Parameters
+    ----------
+    obj : dict or any
+        Object to convert. Dictionaries nested in dictionaries are converted
+        too; any other object is returned unchanged.
+
+    Returns
+    -------
+    types.SimpleNamespace or any
+        Converted object.
+
+    """
+    if isinstance(obj, dict):
+        return SimpleNamespace(
+            **{key: to_namespace(value) for key, value in obj.items()})
+
+    return obj
+
 print_lock = Lock()
 
+_print_queue = SimpleQueue()
+_print_thread = None
+_print_thread_lock = Lock()
+_print_drain_registered = False
+
+# Maximum time to wait for queued output to be printed (seconds), so that a
+# stalled console (or a worker lost in a forked child) cannot block callers
+_PRINT_WAIT_TIMEOUT = 5
+
 def ts_print(*a, **b):
     """
     A thread-safe print() function.
 
-    Attempts to prevent garbled output when printing to a console from multiple
-    threads.
+    Prevents garbled output when printing to a console from multiple threads.
+    The arguments are queued for printing by a background thread (started on
+    first use), so that callers do not contend for print_lock or wait on
+    console I/O. Items are printed in the order they were queued.
+
+    If flush=True, the call returns once the item has been printed and the
+    output flushed (or after _PRINT_WAIT_TIMEOUT seconds at most), keeping
+    it in order with subsequent output not printed through this function
+    (e.g. input() prompts). Use ts_print_async() in time-critical threads.
+
+    """
+    if b.pop("flush", False):
+        printed = Event()
+        _queue_print((a, b, printed))
+        printed.wait(_PRINT_WAIT_TIMEOUT)
+    else:
+        _queue_print((a, b, None))
+
+def null_print(*a, **b):
+    """
+    A print() function that prints nothing.
+
+    Bound in place of ts_print() where output is disabled, so that callers
+    need not check the verbosity (or queue output) on every call.
+
+    """
+
+# Logger printing nothing (see null_print())
+NULL_LOG = null_print
+
+def ts_print_async(*a, **b):
+    """
+    A thread-safe, non-blocking print() function.
+
+    Like ts_print(), but never waits for the output to be printed: the
+    'flush' keyword argument is accepted but ignored (output is flushed once
+    per batch of queued items anyway), so that time-critical threads (e.g.
+    UDP receiving threads) do not wait on console I/O.
+
+    """
+    b.pop("flush", None)
+    _queue_print((a, b, None))
+
+def _queue_print(item):
+    """
+    Queue an item for printing by _print_worker(), starting it if needed.
+
+    The worker is started again if it is not running, e.g. in a child
+    process forked after it was started (threads are not inherited).
 
     """
-    with print_lock:
-        print(*a, **b)
+    global _print_thread, _print_drain_registered
+
+    if _print_thread is None or not _print_thread.is_alive():
+        with _print_thread_lock:
+            if _print_thread is None or not _print_thread.is_alive():
+                _print_thread = Thread(target=_print_worker, daemon=True)
+                _print_thread.start()
+                if not _print_drain_registered:
+                    atexit.register(_drain_print_queue)
+                    _print_drain_registered = True
+
+    _print_queue.put(item)
+
+def _drain_print_queue():
+    """
+    Wait for the items queued before exiting to be printed.
+
+    """
+    printed = Event()
+    _print_queue.put(((), {"end": ""}, printed))
+    printed.wait(_PRINT_WAIT_TIMEOUT)
+
+def _print_worker():
+    """
+    Print items queued by ts_print() and ts_print_async() in batches.
+
+    """
+    while True:
+        batch = [_print_queue.get()]
+        while not _print_queue.empty():
+            batch.append(_print_queue.get_nowait())
+
+        files = set()
+        with print_lock:
+            # Keep the worker alive if printing fails (e.g. closed file)
+            for a, b, _ in batch:
+                try:
+                    print(*a, **b)
+                    files.add(b.get("file") or sys.stdout)
+                except Exception:
+                    traceback.print_exc()
+            for file in files:
+                try:
+                    file.flush()
+                except Exception:
+                    traceback.print_exc()
+
+        for _, _, printed in batch:
+            if printed is not None:
+                printed.set()
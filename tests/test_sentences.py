@@ -29,7 +29,7 @@ import pytest
 from bitstring import BitStream
 
 # Local Modules ---------------------------------------------------------------
-from vdes1000.sentences import EDMSentence, SentenceGenerator
+from vdes1000.sentences import EDMSentence, SentenceGenerator, iec_ascii_6b_to_8b
 
 
 # =============================================================================
@@ -74,6 +74,50 @@ def test_edm_string_generation():
 
     assert edm.string == expected_string
 
+def test_edm_string_reflects_field_changes():
+    edm = EDMSentence(
+        seq_nr=500,
+        source_id=123456789,
+        destination_id=987654321,
+        data="0101010101",
+        n_fill_bits=4,
+        talker_id="VD")
+
+    assert edm.string == "$VDEDM,500,123456789,987654321,0101010101,4*72\r\n"
+
+    edm.seq_nr = 0
+    edm.source_id = ""
+    edm.destination_id = 123456789
+    edm.talker_id = "AI"
+    edm.data = "00000000000"
+    edm.n_fill_bits = 2
+
+    assert edm.string == "$AIEDM,0,,123456789,00000000000,2*6B\r\n"
+
+def test_edm_from_trusted_matches_constructor():
+    kwargs = dict(
+        seq_nr=999,
+        source_id="",
+        destination_id=123456789,
+        data="0101010101",
+        n_fill_bits=4,
+        talker_id="VD")
+
+    edm = EDMSentence._from_trusted(**kwargs)
+
+    assert edm.string == EDMSentence(**kwargs).string
+
+    with pytest.raises(ValueError):
+        edm.seq_nr = 1000
+
+def test_iec_ascii_6b_to_8b_fill_bits():
+    assert iec_ascii_6b_to_8b(BitStream("0b111111")) == "w"
+    assert iec_ascii_6b_to_8b(BitStream("0b11111111"), 4) == "wh"
+    assert iec_ascii_6b_to_8b(BitStream("0b1" * 16), 2) == "wwt"
+
+    with pytest.raises(ValueError):
+        iec_ascii_6b_to_8b(BitStream("0b11111111"), 2)
+
 def test_sentence_generator_creation():
     sg = SentenceGenerator()
 
@@ -94,6 +138,8 @@ def test_sentence_generator_generate_edm_valid_payload():
     assert isinstance(sentence_groups[0][0], EDMSentence)
     assert sentence_groups[0][0].n_fill_bits == 0
     assert sentence_groups[0][0].data == "0" * 664
+    assert sentence_groups[0][0].string == (
+        "$AIEDM,0,,987654321," + "0" * 664 + ",0*59\r\n")
 
 def test_sentence_generator_generate_edm_large_payload_error():
     pi_data_payload_bs = BitStream(664 * 6 + 1)
@@ -121,6 +167,75 @@ def test_generate_edm_sequence_number_increment():
     sg.generate_edm(pi_data_payload_bs, destination_id)
     assert sg.edm_seq_nr == 0
 
+def test_generate_edm_from_bytes():
+    payload = bytes.fromhex("fedcba9876543210ff")
+
+    # Bytes payloads give the same sentences as the equivalent bitstreams
+    for n_bits in (None, 72, 70, 64, 1, 0):
+        payload_bs = BitStream(bytes=payload, length=72 if n_bits is None else n_bits)
+
+        edm_bytes = SentenceGenerator().generate_edm(
+            bytearray(payload), 987654321, n_bits=n_bits)[0][0]
+        edm_bs = SentenceGenerator().generate_edm(payload_bs, 987654321)[0][0]
+
+        assert edm_bytes.string == edm_bs.string
+
+    with pytest.raises(ValueError):
+        SentenceGenerator().generate_edm(payload, 987654321, n_bits=73)
+
+def test_generate_edm_batch():
+    sg = SentenceGenerator()
+
+    sentence_groups = sg.generate_edm_batch(
+        [BitStream(64), BitStream(664 * 6), BitStream("0b111111")],
+        destination_id=987654321)
+
+    assert len(sentence_groups) == 3
+    assert all(len(group) == 1 for group in sentence_groups)
+    assert [group[0].seq_nr for group in sentence_groups] == [0, 1, 2]
+    assert sentence_groups[0][0].data == "0" * 11
+    assert sentence_groups[0][0].n_fill_bits == 2
+    assert sentence_groups[1][0].data == "0" * 664
+    assert sentence_groups[2][0].data == "w"
+    assert sentence_groups[2][0].n_fill_bits == 0
+    assert sg.edm_seq_nr == 3
+
+def test_generate_edm_batch_prebuilt_strings():
+    sg = SentenceGenerator()
+    sg.edm_seq_nr = 995
+
+    sentence_groups = sg.generate_edm_batch(
+        [BitStream(uint=i, length=6 * (i + 1)) for i in range(10)],
+        destination_id=987654321,
+        talker_id="VD")
+
+    # Pre-built strings match the strings built from the sentence fields
+    for group in sentence_groups:
+        edm = group[0]
+        assert edm.string == EDMSentence(
+            edm.seq_nr,
+            edm.source_id,
+            edm.destination_id,
+            edm.data,
+            edm.n_fill_bits,
+            edm.talker_id).string
+
+    # Changing a field invalidates the pre-built string
+    edm = sentence_groups[0][0]
+    edm.data = "0000"
+    assert edm.string == "$VDEDM,995,,987654321,0000,0*46\r\n"
+
+def test_generate_edm_batch_large_payload_error():
+    sg = SentenceGenerator()
+
+    with pytest.raises(ValueError, match="Size of the PI Data Payload exceeds the currently supported maximum."):
+        sg.generate_edm_batch(
+            [BitStream(64), BitStream(664 * 6 + 1)],
+            987654321)
+
+    # No sequence numbers used up by the failed batch
+    assert sg.edm_seq_nr == 0
+
 
 # =============================================================================
 # %% Main Function
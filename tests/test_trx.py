@@ -23,6 +23,7 @@ limitations under the License.
 # %% Import Statements
 # =============================================================================
 # Built-in Modules ------------------------------------------------------------
+from types import SimpleNamespace
 from unittest.mock import MagicMock
 
 # Third-party Modules ---------------------------------------------------------
@@ -46,6 +47,16 @@ def cfg():
                     "listen_ccrd": False,
                     "talker_id": "1",
                     "udp_buffer_size": 4096,
+                    "udp_sndbuf_bytes": 1048576,
+                    "udp_rcvbuf_bytes": 1048576,
+                    "n_listen_sockets_per_port": 1,
+                    "udp_reuse_port": True,
+                    "udp_ip_multicast_all": True,
+                    "udp_ip_multicast_loop": True,
+                    "udp_recv_queue_size": 16384,
+                    "rx_cpu_affinity": [0],
+                    "udp_tx_thread": True,
+                    "udp_share_listen_sockets": True,
                     "udp_verbosity": 3}}
 
     return cfg
@@ -80,11 +91,94 @@ def test_vdes_transceiver_initialization(cfg, mock_udp_interface):
         listen_misc=cfg["user"]["listen_misc"],
         listen_aist=cfg["user"]["listen_aist"],
         listen_ccrd=cfg["user"]["listen_ccrd"],
-        recv_cbk_misc=None,
+        recv_cbk_misc=transceiver._recv_misc,
         recv_cbk_aist=None,
         buffer_size=cfg["user"]["udp_buffer_size"],
+        sndbuf_bytes=cfg["user"]["udp_sndbuf_bytes"],
+        rcvbuf_bytes=cfg["user"]["udp_rcvbuf_bytes"],
+        n_listen_sockets_per_port=cfg["user"]["n_listen_sockets_per_port"],
+        reuse_port=cfg["user"]["udp_reuse_port"],
+        ip_multicast_all=cfg["user"]["udp_ip_multicast_all"],
+        ip_multicast_loop=cfg["user"]["udp_ip_multicast_loop"],
+        recv_queue_size=cfg["user"]["udp_recv_queue_size"],
+        rx_cpu_affinity=cfg["user"]["rx_cpu_affinity"],
+        tx_thread=cfg["user"]["udp_tx_thread"],
+        share_listen_sockets=cfg["user"]["udp_share_listen_sockets"],
         verbosity=cfg["user"]["udp_verbosity"])
 
+    # Check that the receiving sockets were waited for
+    mock_udp_interface.return_value.wait_ready.assert_called_once_with(
+        timeout=10)
+
+def test_vdes_transceiver_initialization_from_namespace(cfg, mock_udp_interface):
+    # Instantiate the VDESTransceiver with an attribute-style configuration
+    transceiver = VDESTransceiver(
+        SimpleNamespace(user=SimpleNamespace(**cfg["user"])))
+
+    # Check that the UDPInterface was initialized with the same parameters
+    mock_udp_interface.assert_called_once_with(
+        ip_address=cfg["user"]["ip_address"],
+        dest_port_misc=cfg["user"]["dest_port_misc"],
+        dest_port_aist=cfg["user"]["dest_port_aist"],
+        dest_port_ccrd=cfg["user"]["dest_port_ccrd"],
+        listen_misc=cfg["user"]["listen_misc"],
+        listen_aist=cfg["user"]["listen_aist"],
+        listen_ccrd=cfg["user"]["listen_ccrd"],
+        recv_cbk_misc=transceiver._recv_misc,
+        recv_cbk_aist=None,
+        buffer_size=cfg["user"]["udp_buffer_size"],
+        sndbuf_bytes=cfg["user"]["udp_sndbuf_bytes"],
+        rcvbuf_bytes=cfg["user"]["udp_rcvbuf_bytes"],
+        n_listen_sockets_per_port=cfg["user"]["n_listen_sockets_per_port"],
+        reuse_port=cfg["user"]["udp_reuse_port"],
+        ip_multicast_all=cfg["user"]["udp_ip_multicast_all"],
+        ip_multicast_loop=cfg["user"]["udp_ip_multicast_loop"],
+        recv_queue_size=cfg["user"]["udp_recv_queue_size"],
+        rx_cpu_affinity=cfg["user"]["rx_cpu_affinity"],
+        tx_thread=cfg["user"]["udp_tx_thread"],
+        share_listen_sockets=cfg["user"]["udp_share_listen_sockets"],
+        verbosity=cfg["user"]["udp_verbosity"])
+
+def test_vdes_transceiver_initialization_listen_error(cfg, mock_udp_interface):
+    # A receiving socket that cannot be bound must not be ignored
+    mock_udp_interface.return_value.wait_ready.side_effect = OSError(
+        98, "Address already in use")
+
+    with pytest.raises(OSError):
+        VDESTransceiver(cfg)
+
+    mock_udp_interface.return_value.close.assert_called_once_with()
+
+def test_vdes_transceiver_initialization_listen_timeout(
+        cfg, mock_udp_interface):
+    mock_udp_interface.return_value.wait_ready.return_value = False
+
+    with pytest.raises(TimeoutError):
+        VDESTransceiver(cfg)
+
+    mock_udp_interface.return_value.close.assert_called_once_with()
+
+def test_recv_misc_sets_response_event(cfg, mock_udp_interface):
+    recv_cbk_misc = MagicMock()
+    trx = VDESTransceiver(cfg, recv_cbk_misc=recv_cbk_misc)
+
+    assert not trx.response_event.is_set()
+
+    trx._recv_misc(("10.0.2.203", 60030), b"$AIABK,,,,,3*5F\r\n")
+
+    recv_cbk_misc.assert_called_once_with(
+        ("10.0.2.203", 60030), b"$AIABK,,,,,3*5F\r\n")
+    assert trx.wait_for_response(timeout=0)
+
+def test_send_clears_response_event(cfg, mock_udp_interface):
+    trx = VDESTransceiver(cfg)
+    trx.udp_interface = mock_udp_interface
+    trx.response_event.set()
+
+    trx.send_vde_data(BitStream(64), 123456789)
+
+    assert not trx.response_event.is_set()
+
 def test_send_ais_msg(cfg, mock_udp_interface):
     # Set up the VDESTransceiver instance with mocked components
     trx = VDESTransceiver(cfg)
@@ -98,10 +192,9 @@ def test_send_ais_msg(cfg, mock_udp_interface):
     trx.send_ais_msg(msg_bs, channel)
 
     # Check if the necessary methods were called
-    calls = mock_udp_interface.send_misc_iec_msg.call_args_list
-    assert len(calls) == 2
-    assert calls[0][0][0] == "\\g:1-1-1,s:1*38\\$AITSA,,0,A,,,2*0D\r\n"
-    assert calls[1][0][0] == "\\g:1-1-2,s:1*3B\\!AIVDM,1,1,0,A,0000000000000000000000000000,0*16\r\n"
+    mock_udp_interface.send_misc_iec_msgs.assert_called_once_with([
+        "\\g:1-1-1,s:1*38\\$AITSA,,0,A,,,2*0D\r\n",
+        "\\g:1-1-2,s:1*3B\\!AIVDM,1,1,0,A,0000000000000000000000000000,0*16\r\n"])
 
 def test_send_ais_binary_broadcast(cfg, mock_udp_interface):
     # Set up the VDESTransceiver instance with mocked components
@@ -116,8 +209,8 @@ def test_send_ais_binary_broadcast(cfg, mock_udp_interface):
     trx.send_ais_binary_broadcast(asm_payload_bs, channel)
 
     # Check if the necessary methods were called
-    mock_udp_interface.send_misc_iec_msg.assert_called_once_with(
-        "\\g:1-1-1,s:1*38\\!AIBBM,1,1,0,1,8,00000000000,2*52\r\n")
+    mock_udp_interface.send_misc_iec_msgs.assert_called_once_with(
+        ["\\g:1-1-1,s:1*38\\!AIBBM,1,1,0,1,8,00000000000,2*52\r\n"])
 
 def test_send_asm_broadcast(cfg, mock_udp_interface):
     # Set up the VDESTransceiver instance with mocked components
@@ -138,8 +231,8 @@ def test_send_asm_broadcast(cfg, mock_udp_interface):
         transmission_format)
 
     # Check if the necessary methods were called
-    mock_udp_interface.send_misc_iec_msg.assert_called_once_with(
-        "\\g:1-1-1,s:1*38\\!AIABB,01,01,0,123456789,1,,0,00000000000,2*67\r\n")
+    mock_udp_interface.send_misc_iec_msgs.assert_called_once_with(
+        ["\\g:1-1-1,s:1*38\\!AIABB,01,01,0,123456789,1,,0,00000000000,2*67\r\n"])
 
 def test_send_vde_data(cfg, mock_udp_interface):
     # Set up the VDESTransceiver instance with mocked components
@@ -156,8 +249,35 @@ def test_send_vde_data(cfg, mock_udp_interface):
         destination_id)
 
     # Check if the necessary methods were called
-    mock_udp_interface.send_misc_iec_msg.assert_called_once_with(
-        "\\g:1-1-1,s:1*38\\$AIEDM,0,,123456789,00000000000,2*6B\r\n")
+    mock_udp_interface.send_misc_iec_msgs.assert_called_once_with(
+        ["\\g:1-1-1,s:1*38\\$AIEDM,0,,123456789,00000000000,2*6B\r\n"])
+
+def test_send_vde_data_bytes(cfg, mock_udp_interface):
+    # Set up the VDESTransceiver instance with mocked components
+    trx = VDESTransceiver(cfg)
+    trx.udp_interface = mock_udp_interface
+
+    # Call the method with a bytes payload, of which only 64 bits are used
+    trx.send_vde_data(bytes(9), 123456789, n_bits=64)
+
+    # Check that the message matches the one for the equivalent bitstream
+    mock_udp_interface.send_misc_iec_msgs.assert_called_once_with([
+        "\\g:1-1-1,s:1*38\\$AIEDM,0,,123456789,00000000000,2*6B\r\n"])
+
+def test_send_vde_data_batch(cfg, mock_udp_interface):
+    # Set up the VDESTransceiver instance with mocked components
+    trx = VDESTransceiver(cfg)
+    trx.udp_interface = mock_udp_interface
+
+    # Call the method
+    trx.send_vde_data_batch(
+        [BitStream(64), BitStream(64)],
+        123456789)
+
+    # Check if the necessary methods were called
+    mock_udp_interface.send_misc_iec_msgs.assert_called_once_with([
+        "\\g:1-1-1,s:1*38\\$AIEDM,0,,123456789,00000000000,2*6B\r\n",
+        "\\g:1-1-2,s:1*3B\\$AIEDM,1,,123456789,00000000000,2*6A\r\n"])
 
 
 # =============================================================================
@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the VDES1000 UDP Interface Modules
+
+Data is exchanged with the interfaces over the loopback interface.
+
+@author: Jan Safar
+
+Copyright 2024 GLA Research and Development Directorate
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+
+"""
+# =============================================================================
+# %% Import Statements
+# =============================================================================
+# Built-in Modules ------------------------------------------------------------
+import socket
+import threading
+import time
+
+# Third-party Modules ---------------------------------------------------------
+import pytest
+
+# Local Modules ---------------------------------------------------------------
+from vdes1000 import udp
+from vdes1000.asyncudp import AsyncUDPInterface
+from vdes1000.udp import SendmmsgBatcher, UDPInterface
+
+# =============================================================================
+# %% Helper Functions
+# =============================================================================
+def get_free_port():
+    # Port not in use at the time of the call
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("", 0))
+        return sock.getsockname()[1]
+
+def recv_all(sock, n):
+    # Receive n datagrams (or fail after the socket's timeout)
+    return [sock.recv(65535) for _ in range(n)]
+
+def wait_until(condition, timeout=5):
+    # Poll a condition until it holds or the timeout expires
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.001)
+
+    return True
+
+def make_interface(cls, port, **kwargs):
+    # Interface sending to/listening on port (misc sentences) only
+    kwargs.setdefault("listen_misc", False)
+    return cls(
+        ip_address="127.0.0.1",
+        dest_port_misc=port,
+        dest_port_aist=get_free_port(),
+        dest_port_ccrd=get_free_port(),
+        listen_aist=False,
+        listen_ccrd=False,
+        **kwargs)
+
+# =============================================================================
+# %% Test Fixtures
+# =============================================================================
+@pytest.fixture(params=["mmsg", "fallback"])
+def mmsg(request, monkeypatch):
+    # Run with sendmmsg()/recvmmsg() (Linux only), and without them as on
+    # other platforms
+    if request.param == "fallback":
+        monkeypatch.setattr(udp, "_sendmmsg", None)
+        monkeypatch.setattr(udp, "_recvmmsg", None)
+    elif udp._sendmmsg is None or udp._recvmmsg is None:
+        pytest.skip("sendmmsg()/recvmmsg() not available")
+
+    return request.param
+
+@pytest.fixture
+def sink():
+    # Socket receiving the data sent by the interfaces
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(2)
+    yield sock
+    sock.close()
+
+@pytest.fixture
+def source():
+    # Socket sending data to the interfaces
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    yield sock
+    sock.close()
+
+# =============================================================================
+# %% Tests - Sending
+# =============================================================================
+@pytest.mark.parametrize("tx_thread", [False, True])
+def test_send_misc_iec_msgs(sink, mmsg, tx_thread):
+    interface = make_interface(
+        UDPInterface, sink.getsockname()[1], tx_thread=tx_thread)
+
+    # Messages are sent in order, whether batched or not
+    msgs = ["msg {:d}".format(i) for i in range(100)]
+    interface.send_misc_iec_msg(b"first")
+    interface.send_misc_iec_msgs(msgs[:50])
+    interface.send_misc_iec_msgs([msg.encode() for msg in msgs[50:]])
+
+    assert interface.await_drain(timeout=5)
+    interface.close()
+
+    assert recv_all(sink, 101) == [b"first"] + [msg.encode() for msg in msgs]
+
+def test_send_misc_iec_msg_non_ascii(sink):
+    interface = make_interface(UDPInterface, sink.getsockname()[1])
+    interface.send_misc_iec_msg("café")
+    interface.close()
+
+    assert sink.recv(100) == "café".encode("utf-8")
+
+def test_send_to_closed_port():
+    # Datagrams refused by the destination are dropped silently
+    interface = make_interface(UDPInterface, get_free_port())
+    for _ in range(3):
+        interface.send_misc_iec_msg("msg")
+        interface.send_misc_iec_msgs(["msg"] * 3)
+        time.sleep(0.01)
+    interface.close()
+
+def test_close_is_idempotent():
+    interface = make_interface(
+        UDPInterface, get_free_port(), listen_misc=True, tx_thread=True,
+        recv_queue_size=4)
+    assert interface.wait_ready(timeout=5)
+
+    interface.close()
+    interface.close()
+
+@pytest.mark.skipif(udp._sendmmsg is None, reason="sendmmsg() not available")
+def test_sendmmsg_headers(sink):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(sink.getsockname())
+
+    # Several sendmmsg() calls per list
+    msgs = [bytes([i]) * (i + 1) for i in range(10)]
+    udp._SendmmsgHeaders(4).send(sock.fileno(), msgs)
+    sock.close()
+
+    assert recv_all(sink, 10) == msgs
+
+# =============================================================================
+# %% Tests - SendmmsgBatcher
+# =============================================================================
+def test_sendmmsg_batcher_batches(sink, mmsg):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(sink.getsockname())
+    batcher = SendmmsgBatcher(sock, batch_size=4, max_delay=0.01)
+
+    # Full batches are sent straight away, the rest after max_delay
+    msgs = [b"msg %d" % i for i in range(10)]
+    for msg in msgs:
+        batcher.send(msg)
+    assert recv_all(sink, 8) == msgs[:8]
+    assert recv_all(sink, 2) == msgs[8:]
+
+    # Sparse datagrams are sent without starting a thread each
+    n_threads = threading.active_count()
+    for msg in msgs:
+        batcher.send(msg)
+        time.sleep(0.002)
+    assert recv_all(sink, 10) == msgs
+    assert threading.active_count() == n_threads
+
+    batcher.close()
+    assert not batcher._flush_thread.is_alive()
+    sock.close()
+
+def test_sendmmsg_batcher_close_flushes(sink):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(sink.getsockname())
+    batcher = SendmmsgBatcher(sock, batch_size=16, max_delay=60)
+
+    # Queued data is copied, and sent on close
+    batcher.send(b"queued")
+    bytearray_msg = bytearray(b"copied")
+    batcher.send(bytearray_msg)
+    bytearray_msg[:] = b"change"
+    batcher.close()
+
+    assert recv_all(sink, 2) == [b"queued", b"copied"]
+
+    # As with a closed socket
+    with pytest.raises(OSError):
+        batcher.send(b"closed")
+    sock.close()
+
+def test_sendmmsg_batcher_oversized(sink):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(sink.getsockname())
+    batcher = SendmmsgBatcher(sock, buffer_size=8)
+
+    with pytest.raises(ValueError, match="8 bytes"):
+        batcher.send(b"0123456789")
+
+    # The batcher is still usable
+    batcher.send(b"01234567")
+    batcher.close()
+    sock.close()
+
+    assert sink.recv(100) == b"01234567"
+
+@pytest.mark.skipif(udp._UDP_SEGMENT is None, reason="UDP GSO not available")
+def test_sendmmsg_batcher_gso(sink):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.connect(sink.getsockname())
+    batcher = SendmmsgBatcher(sock, batch_size=8, max_delay=60, gso=True)
+
+    # Equally sized datagrams (but the last one) are segmented by the kernel
+    msgs = [bytes([i]) * 100 for i in range(7)] + [b"last"]
+    for msg in msgs:
+        batcher.send(msg)
+    batcher.close()
+    sock.close()
+
+    assert recv_all(sink, 8) == msgs
+
+# =============================================================================
+# %% Tests - Receiving
+# =============================================================================
+@pytest.mark.parametrize("recv_zero_copy", [False, True])
+def test_recv_callback(source, mmsg, recv_zero_copy):
+    received = []
+
+    def recv_cbk(address, data):
+        received.append((address, bytes(data)))
+
+    port = get_free_port()
+    interface = make_interface(
+        UDPInterface, port, listen_misc=True, recv_cbk_misc=recv_cbk,
+        recv_zero_copy=recv_zero_copy)
+    assert interface.wait_ready(timeout=5)
+
+    # More datagrams than received per recvmmsg() call
+    msgs = [b"msg %d" % i for i in range(100)]
+    for msg in msgs:
+        source.sendto(msg, ("127.0.0.1", port))
+
+    assert wait_until(lambda: len(received) == len(msgs))
+    interface.close()
+
+    assert received == [(source.getsockname(), msg) for msg in msgs]
+
+@pytest.mark.parametrize("recv_queue_size", [None, 4])
+def test_recv_callback_error(source, capsys, recv_queue_size):
+    received = []
+
+    def recv_cbk(address, data):
+        if data == b"error":
+            raise RuntimeError("callback error")
+        received.append(data)
+
+    port = get_free_port()
+    interface = make_interface(
+        UDPInterface, port, listen_misc=True, recv_cbk_misc=recv_cbk,
+        recv_queue_size=recv_queue_size)
+    assert interface.wait_ready(timeout=5)
+
+    # A failing callback does not stop the reception
+    for msg in [b"before", b"error", b"after"]:
+        source.sendto(msg, ("127.0.0.1", port))
+
+    assert wait_until(lambda: received == [b"before", b"after"])
+    interface.close()
+
+    assert "callback error" in capsys.readouterr().out
+
+@pytest.mark.skipif(udp._recvmmsg is None, reason="recvmmsg() not available")
+def test_recvmmsg_buffers(source):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    bufs = udp._RecvmmsgBuffers(4, 8)
+
+    assert bufs.recv(sock.fileno()) == []
+
+    # Longer datagrams are truncated
+    for msg in [b"a", b"bb", b"0123456789", b"d", b"e"]:
+        source.sendto(msg, sock.getsockname())
+    time.sleep(0.05)
+
+    datagrams = bufs.recv(sock.fileno(), copy=False)
+    assert all(isinstance(data, memoryview) for data, _ in datagrams)
+    assert [(bytes(data), address) for data, address in datagrams] == [
+        (b"a", source.getsockname()),
+        (b"bb", source.getsockname()),
+        (b"01234567", source.getsockname()),
+        (b"d", source.getsockname())]
+    assert bufs.recv(sock.fileno()) == [(b"e", source.getsockname())]
+    sock.close()
+
+def test_recv_queue_drops_oldest(source):
+    received = []
+    release = threading.Event()
+
+    def recv_cbk(address, data):
+        release.wait(5)
+        received.append(data)
+
+    port = get_free_port()
+    interface = make_interface(
+        UDPInterface, port, listen_misc=True, recv_cbk_misc=recv_cbk,
+        recv_queue_size=4)
+    assert interface.wait_ready(timeout=5)
+
+    # At most one datagram is being passed to the blocked callback, and four
+    # are queued
+    msgs = [b"msg %d" % i for i in range(20)]
+    for msg in msgs:
+        source.sendto(msg, ("127.0.0.1", port))
+    assert wait_until(lambda: interface.n_rx_dropped >= 15)
+
+    release.set()
+    assert wait_until(
+        lambda: len(received) + interface.n_rx_dropped == len(msgs))
+    interface.close()
+
+    assert received[-4:] == msgs[-4:]
+
+def test_shared_listen_sockets(source, mmsg):
+    received_1 = []
+    received_2 = []
+
+    port = get_free_port()
+    interface_1 = make_interface(
+        UDPInterface, port, listen_misc=True, share_listen_sockets=True,
+        recv_cbk_misc=lambda address, data: received_1.append(data))
+    interface_2 = make_interface(
+        UDPInterface, port, listen_misc=True, share_listen_sockets=True,
+        recv_cbk_misc=lambda address, data: received_2.append(data))
+
+    # Each datagram is passed to both interfaces
+    msgs = [b"msg %d" % i for i in range(50)]
+    for msg in msgs:
+        source.sendto(msg, ("127.0.0.1", port))
+    assert wait_until(
+        lambda: len(received_1) == len(received_2) == len(msgs))
+    assert received_1 == received_2 == msgs
+
+    # The socket stays open for the remaining interface
+    interface_1.close()
+    source.sendto(b"last", ("127.0.0.1", port))
+    assert wait_until(lambda: received_2[-1:] == [b"last"])
+    assert len(received_1) == len(msgs)
+
+    interface_2.close()
+    assert port not in udp._SHARED_RX_SOCKETS
+
+def test_shared_listen_sockets_bind_error():
+    port = get_free_port()
+    n_threads = threading.active_count()
+
+    # The second port is in use: the shared socket opened for the first one
+    # is released, and no thread is left running
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("", 0))
+        with pytest.raises(OSError):
+            UDPInterface(
+                ip_address="127.0.0.1",
+                dest_port_misc=port,
+                dest_port_aist=sock.getsockname()[1],
+                dest_port_ccrd=get_free_port(),
+                listen_ccrd=False,
+                tx_thread=True,
+                recv_queue_size=4,
+                share_listen_sockets=True)
+
+    assert port not in udp._SHARED_RX_SOCKETS
+    assert wait_until(lambda: threading.active_count() == n_threads)
+
+    # The first port can be bound again
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("", port))
+
+def test_shared_listen_sockets_recv_error(source, monkeypatch):
+    def recv_error(self, sock, copy):
+        raise OSError("recv error")
+
+    port = get_free_port()
+    with monkeypatch.context() as patch:
+        patch.setattr(udp._DatagramReader, "recv", recv_error)
+        interface_1 = make_interface(
+            UDPInterface, port, listen_misc=True, share_listen_sockets=True)
+
+        # The error is reported by the interface listening on the socket
+        source.sendto(b"first", ("127.0.0.1", port))
+        assert wait_until(lambda: udp._SHARED_RX_SOCKETS[port].error)
+        with pytest.raises(OSError, match="recv error"):
+            interface_1.wait_ready(timeout=5)
+
+    # An interface created later listens on a new socket
+    received = []
+    interface_2 = make_interface(
+        UDPInterface, port, listen_misc=True, share_listen_sockets=True,
+        recv_cbk_misc=lambda address, data: received.append(data))
+    assert interface_2.wait_ready(timeout=5)
+    source.sendto(b"second", ("127.0.0.1", port))
+    assert wait_until(lambda: received == [b"second"])
+
+    interface_1.close()
+    assert port in udp._SHARED_RX_SOCKETS
+    interface_2.close()
+    assert port not in udp._SHARED_RX_SOCKETS
+
+def test_wait_ready_port_in_use():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("", 0))
+        interface = make_interface(
+            UDPInterface, sock.getsockname()[1], listen_misc=True)
+
+        with pytest.raises(OSError):
+            interface.wait_ready(timeout=5)
+        interface.close()
+
+# =============================================================================
+# %% Tests - AsyncUDPInterface
+# =============================================================================
+def test_async_send_before_ready(sink):
+    interface = make_interface(AsyncUDPInterface, sink.getsockname()[1])
+
+    # Messages handed over before the sending socket is open are kept
+    msgs = [b"msg %d" % i for i in range(20)]
+    interface.send_misc_iec_msg(msgs[0])
+    interface.send_misc_iec_msgs(msgs[1:])
+    assert interface.await_drain(timeout=5)
+    assert interface.wait_ready(timeout=5)
+    interface.close()
+
+    assert recv_all(sink, 20) == msgs
+
+def test_async_recv_callback(source):
+    received = []
+
+    port = get_free_port()
+    interface = make_interface(
+        AsyncUDPInterface, port, listen_misc=True,
+        recv_cbk_misc=lambda address, data: received.append((address, data)))
+    assert interface.wait_ready(timeout=5)
+
+    msgs = [b"msg %d" % i for i in range(50)]
+    for msg in msgs:
+        source.sendto(msg, ("127.0.0.1", port))
+
+    assert wait_until(lambda: len(received) == len(msgs))
+    interface.close()
+    interface.close()
+
+    assert received == [(source.getsockname(), msg) for msg in msgs]
+
+def test_async_wait_ready_port_in_use():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("", 0))
+        interface = make_interface(
+            AsyncUDPInterface, sock.getsockname()[1], listen_misc=True)
+
+        with pytest.raises(OSError):
+            interface.wait_ready(timeout=5)
+        interface.close()
+
+def test_async_close_before_ready():
+    port = get_free_port()
+
+    # Sockets still being opened are closed too
+    for _ in range(20):
+        interface = make_interface(AsyncUDPInterface, port, listen_misc=True)
+        interface.close()
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind(("", port))